@@ -11,14 +11,62 @@ import os
 import sys
 import json
 import datetime
+import time
 import xml.etree.ElementTree as ET
 import gzip
+import io
 import re
 import urllib.request
+import urllib.error
+import email.utils
 import traceback
+import logging
+import multiprocessing
+import array
+import atexit
+import bisect
+import codecs
+import functools
+import heapq
+import itertools
 import hashlib
-import shutil
-import urllib.parse
+import pickle
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from operator import itemgetter
+from xml.sax.saxutils import escape as xml_escape
+
+try:
+    # 可选依赖：安装lxml后外部EPG使用libxml2解析（更快），未安装时回退标准库
+    from lxml import etree as XML_PARSER
+except ImportError:
+    XML_PARSER = ET
+
+try:
+    # 可选依赖：安装isal后gzip压缩/解压使用ISA-L加速，未安装时回退标准库
+    from isal import igzip as GZIP_MODULE
+    GZIP_MAX_COMPRESS_LEVEL = 3  # ISA-L只支持0~3档
+except ImportError:
+    GZIP_MODULE = gzip
+    GZIP_MAX_COMPRESS_LEVEL = 9
+
+try:
+    # isal较新版本提供多线程压缩写入（压缩在后台线程中进行）
+    from isal import igzip_threaded as GZIP_THREADED
+except ImportError:
+    GZIP_THREADED = None
+
+try:
+    # 可选依赖：安装requests后下载复用HTTP连接（keep-alive），同一主机的多次请求不必重复建连/握手；未安装时回退urllib
+    import requests as HTTP_REQUESTS
+except ImportError:
+    HTTP_REQUESTS = None
+
+try:
+    # 可选依赖：安装orjson后JSON解析更快（直接接受bytes），未安装时回退标准库
+    from orjson import loads as JSON_LOADS
+except ImportError:
+    JSON_LOADS = json.loads
 
 
 # ===================== EPG配置区 =====================
@@ -44,6 +92,9 @@ EPG_CONFIG = {
     'CLEAN_SUFFIX': ["4k", "4K", "SDR", "HDR", "超高清", "英语", "英文"],
     'TIMEOUT': 30,
     'RETRY_TIMES': 2,
+    'GZ_COMPRESS_LEVEL': 1,  # 输出gz压缩等级（每次运行都重新生成，取快速档：体积略增，压缩快数倍）
+    'DOWNLOAD_WORKERS': 8,  # 并发下载线程数（外部源/官方节目单）
+    'PARSE_WORKERS': 4,  # 外部源并行解析进程数（≤1则在主进程逐个解析）
     'EXTERNAL_EPG_SOURCES': [                              
         {
             "url": "https://raw.githubusercontent.com/zzzz0317/beijing-unicom-iptv-playlist/main/epg.xml.gz",
@@ -125,58 +176,192 @@ EPG_CONFIG = {
 
 
 # ===================== 核心去重函数（仅时间判断） =====================
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+@functools.lru_cache(maxsize=131072)
 def parse_time_str_to_timestamp(time_str):
-    """解析EPG时间字符串为时间戳（格式：YYYYMMDDHHMMSS +0800）"""
+    """解析EPG时间字符串为时间戳（格式：YYYYMMDDHHMMSS +0800）
+    仅用于同频道区间比较，按naive时间计算（忽略时区后缀）；
+    标准14位数字直接切片，避开strptime，其余格式走strptime兜底"""
     try:
         time_part = time_str.split(' ')[0]
-        dt = datetime.datetime.strptime(time_part, "%Y%m%d%H%M%S")
-        return dt.timestamp()
+        if len(time_part) == 14 and time_part.isdigit():
+            dt = datetime.datetime(
+                int(time_part[0:4]), int(time_part[4:6]), int(time_part[6:8]),
+                int(time_part[8:10]), int(time_part[10:12]), int(time_part[12:14])
+            )
+        else:
+            dt = datetime.datetime.strptime(time_part, "%Y%m%d%H%M%S")
+        return (dt - _EPOCH).total_seconds()
+    except Exception:
+        return None
+
+def official_time_to_epg_str(time_str):
+    """官方节目单时间（YYYY-MM-DD HH:MM:SS）转EPG时间字符串，非法返回None"""
+    try:
+        if (len(time_str) == 19 and time_str[4] == '-' and time_str[7] == '-' and time_str[10] == ' '
+                and time_str[13] == ':' and time_str[16] == ':'):
+            dt = datetime.datetime(
+                int(time_str[0:4]), int(time_str[5:7]), int(time_str[8:10]),
+                int(time_str[11:13]), int(time_str[14:16]), int(time_str[17:19])
+            )
+        else:
+            dt = datetime.datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
     except Exception:
         return None
+    return dt.strftime("%Y%m%d%H%M%S +0800")
 
 def is_time_overlap(new_start_ts, new_end_ts, exist_start_ts, exist_end_ts):
     """判断两个时间区间是否重合"""
     return new_start_ts < exist_end_ts and exist_start_ts < new_end_ts
 
-def add_program_if_no_time_overlap(programme_list, channel_time_ranges, new_prog):
-    """仅当新节目与已有节目无时间重合时，才添加到列表"""
-    channel = new_prog.get("channel")
-    start_str = new_prog.get("start")
-    stop_str = new_prog.get("stop")
-    
+def new_time_ranges():
+    """新建频道区间表 (starts, ends, odd_ranges)
+    开始/结束时间各存一个array('d')（每条8字节，比元组/浮点对象列表省内存），异常区间仍用列表"""
+    return (array.array('d'), array.array('d'), [])
+
+def insert_time_range_if_no_overlap(time_ranges, new_start_ts, new_end_ts):
+    """区间与已有区间均不重合时记录该区间并返回True，否则返回False
+    time_ranges = (starts, ends, odd_ranges)：
+    正常区间按开始时间有序存放且互不重合，二分定位后只需检查前后相邻两个区间；
+    起止颠倒/零长度的异常区间单独存放，逐个检查"""
+    starts, ends, odd_ranges = time_ranges
+
+    for (exist_start_ts, exist_end_ts) in odd_ranges:
+        if is_time_overlap(new_start_ts, new_end_ts, exist_start_ts, exist_end_ts):
+            return False
+
+    if new_start_ts < new_end_ts:
+        idx = bisect.bisect_right(starts, new_start_ts)
+        if idx > 0 and ends[idx - 1] > new_start_ts:
+            return False
+        if idx < len(starts) and starts[idx] < new_end_ts:
+            return False
+        starts.insert(idx, new_start_ts)
+        ends.insert(idx, new_end_ts)
+    else:
+        for (exist_start_ts, exist_end_ts) in zip(starts, ends):
+            if is_time_overlap(new_start_ts, new_end_ts, exist_start_ts, exist_end_ts):
+                return False
+        odd_ranges.append((new_start_ts, new_end_ts))
+    return True
+
+def add_program_if_no_time_overlap(programme_map, channel_time_ranges, channel, start_str, stop_str, title):
+    """仅当新节目与已有节目无时间重合时，才添加到节目表
+    programme_map按频道分组：channel -> {(start, title): (channel, start, stop, title)}，插入时即去重
+    先做时间重合判断并记录区间，再按键去重：同键节目（如stop不同的起止颠倒/零长度节目）照常占用时间区间
+    并计为新增，只是节目表保留首条，与先整体收集再输出时去重的结果一致"""
     if not channel or not start_str or not stop_str:
         return False
-    
+
     new_start_ts = parse_time_str_to_timestamp(start_str)
     new_end_ts = parse_time_str_to_timestamp(stop_str)
     if new_start_ts is None or new_end_ts is None:
         return False
-    
+
     if channel not in channel_time_ranges:
-        channel_time_ranges[channel] = []
-    
-    for (exist_start_ts, exist_end_ts) in channel_time_ranges[channel]:
-        if is_time_overlap(new_start_ts, new_end_ts, exist_start_ts, exist_end_ts):
-            return False
-    
-    programme_list.append(new_prog)
-    channel_time_ranges[channel].append((new_start_ts, new_end_ts))
+        channel_time_ranges[channel] = new_time_ranges()
+    if not insert_time_range_if_no_overlap(channel_time_ranges[channel], new_start_ts, new_end_ts):
+        return False
+
+    programme_map.setdefault(channel, {}).setdefault((start_str, title), (channel, start_str, stop_str, title))
     return True
 
+def add_programs_if_no_time_overlap(programme_map, channel_time_ranges, channel, progs):
+    """把同一频道的一批节目逐条按时间重合规则去重后加入列表，返回新增条数
+    （频道区间只查找一次，批量合并外部源节目时使用；progs为 (start, stop, title) 元组）
+    与add_program_if_no_time_overlap相同：先判断时间重合并记录区间，再按键保留首条"""
+    if not channel:
+        return 0
+    if channel not in channel_time_ranges:
+        channel_time_ranges[channel] = new_time_ranges()
+    time_ranges = channel_time_ranges[channel]
+    channel_progs = programme_map.setdefault(channel, {})
+
+    added_count = 0
+    for start_str, stop_str, title in progs:
+        if not start_str or not stop_str:
+            continue
+        new_start_ts = parse_time_str_to_timestamp(start_str)
+        new_end_ts = parse_time_str_to_timestamp(stop_str)
+        if new_start_ts is None or new_end_ts is None:
+            continue
+        if insert_time_range_if_no_overlap(time_ranges, new_start_ts, new_end_ts):
+            channel_progs.setdefault((start_str, title), (channel, start_str, stop_str, title))
+            added_count += 1
+    return added_count
+
+def sort_programme_map(programme_map):
+    """按 (channel, start) 排序输出全部节目行
+    各频道节目互不相交，只需频道名排序后逐个频道按开始时间排序再依次拼接，
+    不必对全部节目做一次全局排序；sorted稳定，同键顺序与插入顺序一致"""
+    sorted_progs = []
+    for channel in sorted(programme_map):
+        sorted_progs.extend(sorted(programme_map[channel].values(), key=itemgetter(1)))
+    return sorted_progs
+
 # ===================== 工具函数 =====================
-def write_log(content, section="INFO"):
+_PARSED_CACHE_VERSION = 1  # 解析结果结构变化时递增，使旧的解析缓存失效
+_XML_ATTRIB_ENTITIES = {'"': "&quot;", "\r": "&#13;", "\n": "&#10;", "\t": "&#09;"}
+
+_LOGGER = logging.getLogger("epg")
+_LOGGER.setLevel(logging.INFO)
+_LOGGER.propagate = False
+_ERROR_LOG_SECTIONS = ("ERROR", "FATAL", "FAIL")  # 以这些结尾的日志分类按ERROR级别记录，写入后立即落盘
+_LOG_SKIP_DETAIL = os.environ.get("EPG_LOG_DETAIL", "1") == "0"  # 环境变量EPG_LOG_DETAIL=0时不记录*_DETAIL明细日志
+
+class BufferedFileHandler(logging.FileHandler):
+    """日志文件使用64KB缓冲，不在每条记录后flush；ERROR级别记录立即写出，
+    关闭时（含退出时logging.shutdown）及atexit时写出剩余内容"""
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=1 << 16, encoding=self.encoding, errors=self.errors)
+
+    def emit(self, record):
+        logging.FileHandler.emit(self, record)
+        if record.levelno >= logging.ERROR:
+            self.flush_buffer()
+
+    def flush(self):
+        pass
+
+    def flush_buffer(self):
+        logging.FileHandler.flush(self)
+
+def flush_log():
+    """立即写出日志缓冲（创建子进程前/子进程任务结束时调用，保证日志先后顺序且不丢失）"""
+    for handler in _LOGGER.handlers:
+        if isinstance(handler, BufferedFileHandler):
+            handler.flush_buffer()
+
+atexit.register(flush_log)
+
+def setup_logger():
+    """配置一次日志：文件句柄常驻打开（不再每条日志重新open），同时输出到控制台"""
+    for handler in list(_LOGGER.handlers):
+        _LOGGER.removeHandler(handler)
+        handler.close()
+    formatter = logging.Formatter("[%(asctime)s] [%(section)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
     log_path = EPG_CONFIG['LOG_PATH']
     try:
         log_dir = os.path.dirname(log_path)
         if log_dir and not os.path.exists(log_dir):
             os.makedirs(log_dir, exist_ok=True)
-        
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(f"[{timestamp}] [{section}] {content}\n")
-        print(f"[{timestamp}] [{section}] {content}")
+        file_handler = BufferedFileHandler(log_path, mode="a", encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        _LOGGER.addHandler(file_handler)
     except Exception as e:
         print(f"日志写入失败：{str(e)}")
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+    _LOGGER.addHandler(stream_handler)
+
+def write_log(content, section="INFO"):
+    if _LOG_SKIP_DETAIL and section.endswith("_DETAIL"):
+        return
+    if not _LOGGER.handlers:
+        setup_logger()
+    level = logging.ERROR if section.endswith(_ERROR_LOG_SECTIONS) else logging.INFO
+    _LOGGER.log(level, content, extra={"section": section})
 
 def get_nested_value(data, path_list):
     if not isinstance(data, dict) or not path_list:
@@ -188,44 +373,216 @@ def get_nested_value(data, path_list):
         current = current[key]
     return current
 
-def compress_xml_to_gz(xml_path, gz_path):
-    try:
-        write_log(f"开始压缩：{xml_path} → {gz_path}", "GZ_COMPRESS")
-        with open(xml_path, 'rb') as f_in:
-            with gzip.open(gz_path, 'wb', compresslevel=6) as f_out:
-                shutil.copyfileobj(f_in, f_out)
-        if os.path.exists(gz_path):
-            gz_size = os.path.getsize(gz_path)
-            xml_size = os.path.getsize(xml_path)
-            ratio = round((1 - gz_size/xml_size) * 100, 2)
-            write_log(f"压缩成功！原{xml_size}字节 → 压缩后{gz_size}字节（{ratio}%）", "GZ_SUCCESS")
-            print(f"  → 压缩完成：{gz_path}（{ratio}%）")
-            return True
-        else:
-            write_log("压缩文件生成失败", "GZ_FAIL")
-            return False
-    except Exception as e:
+def xml_escape_attrib(text):
+    """与ElementTree序列化属性值时的转义规则一致"""
+    return xml_escape(text, _XML_ATTRIB_ENTITIES)
+
+def get_gz_compress_level():
+    """输出gz实际使用的压缩等级"""
+    return max(0, min(EPG_CONFIG['GZ_COMPRESS_LEVEL'], GZIP_MAX_COMPRESS_LEVEL))
+
+def open_gz_writer(gz_path):
+    """打开gz输出流：有isal多线程压缩时按CPU核数并行压缩，否则单线程
+    压缩等级取配置GZ_COMPRESS_LEVEL，超出当前压缩库支持范围时取最高档"""
+    compress_level = get_gz_compress_level()
+    if GZIP_THREADED is not None:
+        return GZIP_THREADED.open(gz_path, "wb", compresslevel=compress_level, threads=os.cpu_count() or 1)
+    return GZIP_MODULE.open(gz_path, "wb", compresslevel=compress_level)
+
+class TeeWriter(io.RawIOBase):
+    """把写入的字节同时转发给多个二进制文件（XML原文与其gz压缩流），一次生成两份输出"""
+    def __init__(self, *targets):
+        super().__init__()
+        self.targets = targets
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        for target in self.targets:
+            target.write(data)
+        return len(data)
+
+class GzOutput:
+    """gz输出流的容错包装：打开/写入/关闭gz出错时记录GZ_ERROR并删除不完整的gz文件，
+    之后的数据直接丢弃，XML原文照常写完（与原先压缩失败只影响gz一致）"""
+    def __init__(self, gz_path):
+        self.gz_path = gz_path
+        self.gz_file = None
+        try:
+            self.gz_file = open_gz_writer(gz_path)
+        except Exception as e:
+            self.fail(e)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def fail(self, e):
         write_log(f"压缩失败：{str(e)}", "GZ_ERROR")
         print(f"  ❌ 压缩失败：{str(e)}")
+        gz_file, self.gz_file = self.gz_file, None
+        if gz_file is not None:
+            try:
+                gz_file.close()
+            except Exception:
+                pass
+        try:
+            os.remove(self.gz_path)
+        except OSError:
+            pass
+
+    def write(self, data):
+        if self.gz_file is not None:
+            try:
+                self.gz_file.write(data)
+            except Exception as e:
+                self.fail(e)
+
+    def close(self):
+        gz_file, self.gz_file = self.gz_file, None
+        if gz_file is not None:
+            try:
+                gz_file.close()
+            except Exception as e:
+                self.fail(e)
+
+class Utf8IgnoreReader:
+    """按块读取字节流，按UTF-8解码并丢弃非法字节后再编码回UTF-8
+    与原先整体decode("utf-8", errors="ignore")结果一致，供只接受bytes的lxml流式读取"""
+    def __init__(self, raw):
+        self.raw = raw
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+
+    def read(self, size=-1):
+        while True:
+            data = self.raw.read(size)
+            text = self.decoder.decode(data, final=not data)
+            if text or not data:
+                return text.encode("utf-8")
+
+def write_epg_xml(xml_path, gz_path, generator_name, generated_time, channels, programmes):
+    """流式写出XMLTV文件：不构建Element树，逐个频道/节目写入转义后的字符串，
+    同一份字节流同时写入XML与gz文件（不再写完XML后回读压缩），gz出错时只记录日志并保留XML
+    channels为 (频道ID, [显示名...])，programmes为 (channel, start, stop, title)的可迭代对象；
+    输出与ElementTree.write(xml_declaration=True, short_empty_elements=False)逐字节一致
+    返回 (写入节目数, 非"未知节目"数)"""
+    prog_count = 0
+    non_unknown_count = 0
+    with open(xml_path, "wb") as xml_file, GzOutput(gz_path) as gz_file:
+        tee = io.BufferedWriter(TeeWriter(xml_file, gz_file), 1024 * 1024)
+        with io.TextIOWrapper(tee, encoding="utf-8", errors="xmlcharrefreplace") as f:
+            write = f.write
+            write("<?xml version='1.0' encoding='UTF-8'?>\n")
+            write(f'<tv generator-info-name="{xml_escape_attrib(generator_name)}" '
+                  f'generator-info-url="https://github.com/jackycher/my-epg-generator" '
+                  f'generated-time="{xml_escape_attrib(generated_time)}">')
+            for channel_id, display_names in channels:
+                write(f'<channel id="{xml_escape_attrib(channel_id)}">')
+                for display_name in display_names:
+                    write(f'<display-name lang="zh">{xml_escape(display_name)}</display-name>')
+                write('</channel>')
+            for channel, start, stop, title in programmes:
+                write(f'<programme start="{xml_escape_attrib(start)}" stop="{xml_escape_attrib(stop)}" '
+                      f'channel="{xml_escape_attrib(channel)}"><title lang="zh">{xml_escape(title)}</title></programme>')
+                prog_count += 1
+                if title != "未知节目":
+                    non_unknown_count += 1
+            write('</tv>')
+    return prog_count, non_unknown_count
+
+def iter_valid_programmes(programmes, valid_channel_ids=None, dedup=False):
+    """过滤缺字段/频道不在valid_channel_ids中的节目；dedup为True时按 (channel, start, title) 去重（保留首条）
+    dedup要求programmes已按 (channel, start) 排序：重复项必然相邻，只需记住当前 (channel, start) 下出现过的标题，
+    不必维护覆盖全部节目的去重集合"""
+    last_slot = None
+    seen_titles = set()
+    for prog in programmes:
+        channel, start, stop, title = prog
+        if valid_channel_ids is not None and channel not in valid_channel_ids:
+            continue
+        if not channel or not start or not title:
+            continue
+        if dedup:
+            slot = (channel, start)
+            if slot != last_slot:
+                last_slot = slot
+                seen_titles.clear()
+            elif title in seen_titles:
+                continue
+            seen_titles.add(title)
+        yield prog
+
+def report_gz_ratio(xml_path, gz_path):
+    """记录gz文件相对XML原文的压缩率"""
+    if not os.path.exists(gz_path):
+        write_log("压缩文件生成失败", "GZ_FAIL")
         return False
+    gz_size = os.path.getsize(gz_path)
+    xml_size = os.path.getsize(xml_path)
+    ratio = round((1 - gz_size/xml_size) * 100, 2) if xml_size else 0
+    write_log(f"压缩成功！原{xml_size}字节 → 压缩后{gz_size}字节（{ratio}%，压缩等级{get_gz_compress_level()}）", "GZ_SUCCESS")
+    print(f"  → 压缩完成：{gz_path}（{ratio}%）")
+    return True
+
+def get_url_hash(url):
+    """缓存文件名用的URL摘要（非安全用途，blake2b比md5更快；8字节摘要对缓存键已足够）"""
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=8).hexdigest()
+
+_HTTP_LOCAL = threading.local()
+_HTTP_SESSIONS = []  # 各线程创建的Session，运行结束时统一关闭
+_HTTP_SESSIONS_LOCK = threading.Lock()
 
-def get_url_md5(url):
-    encoded_url = urllib.parse.quote_plus(url).encode('utf-8')
-    return hashlib.md5(encoded_url).hexdigest()
+def get_http_session():
+    """每个下载线程一个requests.Session（Session不保证线程安全），线程内的后续请求复用连接"""
+    session = getattr(_HTTP_LOCAL, "session", None)
+    if session is None:
+        session = HTTP_REQUESTS.Session()
+        _HTTP_LOCAL.session = session
+        with _HTTP_SESSIONS_LOCK:
+            _HTTP_SESSIONS.append(session)
+    return session
+
+def close_http_sessions():
+    """关闭全部下载线程的Session，释放连接池中的连接"""
+    with _HTTP_SESSIONS_LOCK:
+        sessions = _HTTP_SESSIONS[:]
+        _HTTP_SESSIONS.clear()
+    for session in sessions:
+        session.close()
+
+def http_get(url, headers, timeout):
+    """GET请求，返回 (状态码, 响应头, 内容)；非200状态码（含304）不抛异常，网络错误照常抛出
+    声明接受gzip传输编码（节目单JSON等文本压缩后体积小数倍），返回的内容已解码；requests会自动处理"""
+    if HTTP_REQUESTS is not None:
+        res = get_http_session().get(url, headers=headers, timeout=timeout)
+        return res.status_code, res.headers, res.content
+    req = urllib.request.Request(url, headers={**headers, "Accept-Encoding": "gzip"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            content = res.read()
+            if (res.headers.get("Content-Encoding") or "").lower() == "gzip":
+                content = GZIP_MODULE.decompress(content)
+            return res.status, res.headers, content
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, b""
 
 def download_with_cache(url, cache_dir, timeout=30, retry=2):
     if not os.path.exists(cache_dir):
         os.makedirs(cache_dir, exist_ok=True)
     
-    url_md5 = get_url_md5(url)
-    cache_file = os.path.join(cache_dir, f"{url_md5}.txt")
-    old_cache_file = os.path.join(cache_dir, f"{url_md5}_old.txt")
+    url_hash = get_url_hash(url)
+    cache_file = os.path.join(cache_dir, f"{url_hash}.txt")
+    old_cache_file = os.path.join(cache_dir, f"{url_hash}_old.txt")
+    # 记录上次响应的ETag/Last-Modified，供条件请求使用
+    meta_file = os.path.join(cache_dir, f"{url_hash}.meta.json")
     
     if os.path.exists(cache_file):
         try:
-            if os.path.exists(old_cache_file):
-                os.remove(old_cache_file)
-            os.rename(cache_file, old_cache_file)
+            # os.replace覆盖已有备份，一次系统调用完成（Windows下同样可覆盖）
+            os.replace(cache_file, old_cache_file)
             write_log(f"备份旧缓存：{old_cache_file}", "CACHE")
         except Exception as e:
             write_log(f"备份缓存失败：{e}", "CACHE_ERROR")
@@ -233,31 +590,63 @@ def download_with_cache(url, cache_dir, timeout=30, retry=2):
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
     }
+    # 有旧缓存时发送条件请求，服务端未更新则返回304，无需重新传输
+    if os.path.exists(old_cache_file):
+        cache_meta = {}
+        if os.path.exists(meta_file):
+            try:
+                with open(meta_file, "rb") as f:
+                    cache_meta = JSON_LOADS(f.read())
+            except Exception as e:
+                write_log(f"读取缓存元数据失败：{e}", "CACHE_ERROR")
+        if cache_meta.get("etag"):
+            headers["If-None-Match"] = cache_meta["etag"]
+        headers["If-Modified-Since"] = cache_meta.get("last_modified") or email.utils.formatdate(os.path.getmtime(old_cache_file), usegmt=True)
     download_success = False
+    not_modified = False
     for i in range(retry + 1):
         try:
             write_log(f"下载（重试{i}/{retry}）：{url}", "DOWNLOAD")
-            req = urllib.request.Request(url, headers=headers)
-            with urllib.request.urlopen(req, timeout=timeout) as res:
-                if res.status == 200:
-                    with open(cache_file, 'wb') as f:
-                        f.write(res.read())
-                    download_success = True
-                    write_log(f"下载成功，缓存到：{cache_file}", "DOWNLOAD_SUCCESS")
-                    break
-                else:
-                    write_log(f"下载失败，状态码：{res.status}", "DOWNLOAD_ERROR")
+            status, res_headers, content = http_get(url, headers, timeout)
+            if status == 200:
+                with open(cache_file, 'wb') as f:
+                    f.write(content)
+                # 缓存文件修改时间对齐服务端Last-Modified，供下次条件请求使用
+                last_modified = res_headers.get("Last-Modified")
+                if last_modified:
+                    try:
+                        mtime = email.utils.parsedate_to_datetime(last_modified).timestamp()
+                        os.utime(cache_file, (mtime, mtime))
+                    except Exception:
+                        pass
+                try:
+                    with open(meta_file, "w", encoding="utf-8") as f:
+                        json.dump({"etag": res_headers.get("ETag"), "last_modified": last_modified}, f)
+                except Exception as e:
+                    write_log(f"写入缓存元数据失败：{e}", "CACHE_ERROR")
+                download_success = True
+                write_log(f"下载成功，缓存到：{cache_file}", "DOWNLOAD_SUCCESS")
+                break
+            elif status == 304:
+                not_modified = True
+                break
+            else:
+                write_log(f"下载失败，状态码：{status}", "DOWNLOAD_ERROR")
         except Exception as e:
             write_log(f"下载重试{i}失败：{e}", "DOWNLOAD_ERROR")
             continue
     
-    if download_success:
+    if not_modified:
+        os.replace(old_cache_file, cache_file)
+        write_log(f"远程文件未更新（304），沿用缓存：{cache_file}", "CACHE_NOT_MODIFIED")
+        return cache_file
+    elif download_success:
         if os.path.exists(old_cache_file):
             os.remove(old_cache_file)
         return cache_file
     else:
         if os.path.exists(old_cache_file):
-            os.rename(old_cache_file, cache_file)
+            os.replace(old_cache_file, cache_file)
             write_log(f"下载失败，使用旧缓存：{cache_file}", "CACHE_FALLBACK")
             return cache_file
         else:
@@ -280,104 +669,124 @@ def get_local_path(path):
             raise Exception(f"本地文件不存在：{path}")
         return path
 
+_STRIP_TBL = str.maketrans("", "", "- ")
+# 一次替换同时去掉画质后缀与所有空白（后缀分支在前，与先去后缀再去空白的结果一致）
+_CLEAN_RE = re.compile(r"(?:\s*[-_()]?\s*(?:4K|SDR|HDR|超清))+$|\s+", re.IGNORECASE)
+_CCTV_RE = re.compile(r'CCTV(4K|\d+\+?)')
+_KEEP_4K_RE = re.compile(r"CCTV4K|4K超高清|爱上4K")
+
+@functools.lru_cache(maxsize=65536)
 def clean_channel_name(raw_name):
     if not raw_name:
         return ""
     raw_name = str(raw_name)
     
-    if "4K" in raw_name and any(key in raw_name for key in ["CCTV4K", "4K超高清", "爱上4K"]):
-        return raw_name.replace("-", "").replace(" ", "")
+    if "4K" in raw_name and _KEEP_4K_RE.search(raw_name):
+        return raw_name.translate(_STRIP_TBL)
     
     if raw_name in EPG_CONFIG['KEEP_4K_NAMES']:
         return raw_name
     
-    raw_name = raw_name.replace("-", "").replace(" ", "")
-    suffix_pattern = r"(\s*[-_()]?\s*(4K|SDR|HDR|超清))+$"
-    clean_name = re.sub(suffix_pattern, "", raw_name, flags=re.IGNORECASE).strip()
-    return re.sub(r"\s+", "", clean_name)
+    # 删除"-"/空格用translate，再用一次预编译正则替换去后缀与剩余空白
+    return _CLEAN_RE.sub("", raw_name.translate(_STRIP_TBL))
 
-def fuzzy_match(local_clean_name, ext_names, clean_ext_name=True):
+def build_ext_candidates(ext_names, clean_ext_name=True):
+    """每个外部源只清洗一次频道名，并建立精确匹配索引，供fuzzy_match对所有待匹配频道复用
+    clean_index: 清洗名 -> 首个候选；tag_index: CCTV编号 -> 候选列表；noplus_index: 去"+"名 -> 候选列表
+    by_len/lens: 按清洗名长度稳定排序的候选及其长度，包含匹配只需扫描长度窗口且首个命中即最短
+    cgtn_doc: 首个CGTN纪录频道；cctv4k: 最短的CCTV4K频道（两条固定规则的结果与本地频道无关，预先算好）"""
+    candidates = []
+    clean_index = {}
+    tag_index = {}
+    noplus_index = {}
+    for ext_name in ext_names:
+        ext_clean = clean_channel_name(ext_name) if clean_ext_name else ext_name.strip().replace(" ", "")
+        ext_cctv_match = _CCTV_RE.search(ext_clean)
+        ext = {
+            "clean": ext_clean,
+            "tag": ext_cctv_match.group(1) if ext_cctv_match else None,
+            "original": ext_name,
+            "len": len(ext_clean)
+        }
+        candidates.append(ext)
+        clean_index.setdefault(ext_clean, ext)
+        if ext["tag"]:
+            tag_index.setdefault(ext["tag"], []).append(ext)
+        noplus_index.setdefault(ext_clean.replace("+", ""), []).append(ext)
+    by_len = sorted(candidates, key=lambda x: x["len"])
+    cgtn_doc = next((ext for ext in candidates if "CGTN" in ext["clean"] and "纪录" in ext["clean"]), None)
+    cctv4k = next((ext for ext in by_len if "CCTV4K" in ext["clean"]), None)
+    return {
+        "all": candidates,
+        "cgtn_doc": cgtn_doc,
+        "cctv4k": cctv4k,
+        "by_len": by_len,
+        "lens": [ext["len"] for ext in by_len],
+        "clean_index": clean_index,
+        "tag_index": tag_index,
+        "noplus_index": noplus_index
+    }
+
+def fuzzy_match(local_clean_name, ext_candidates, keep_4k_names):
     if not local_clean_name:
         return None
     
-    if "CGTN" in local_clean_name and "纪录" in local_clean_name:
-        for ext_name in ext_names:
-            ext_clean = clean_channel_name(ext_name) if clean_ext_name else ext_name.strip().replace(" ", "")
-            if "CGTN" in ext_clean and "纪录" in ext_clean and "英文" in ext_clean:
-                return ext_name
-            elif "CGTN" in ext_clean and "纪录" in ext_clean:
-                return ext_name
+    if "CGTN" in local_clean_name and "纪录" in local_clean_name and ext_candidates["cgtn_doc"]:
+        return ext_candidates["cgtn_doc"]["original"]
     
     is_cctv4_europe = "CCTV4" in local_clean_name and "欧洲" in local_clean_name
     is_cctv4_america = "CCTV4" in local_clean_name and "美洲" in local_clean_name
     is_cctv4k = "CCTV4K" in local_clean_name
-    local_is_4k = is_cctv4k or local_clean_name in EPG_CONFIG['KEEP_4K_NAMES']
+    local_is_4k = is_cctv4k or local_clean_name in keep_4k_names
 
-    cctv_pattern = re.compile(r'CCTV(4K|\d+\+?)')
-    local_cctv_tag = cctv_pattern.search(local_clean_name).group(1) if cctv_pattern.search(local_clean_name) else None
+    local_cctv_match = _CCTV_RE.search(local_clean_name)
+    local_cctv_tag = local_cctv_match.group(1) if local_cctv_match else None
     
-    ext_candidate = []
-    for ext_name in ext_names:
-        ext_clean = clean_channel_name(ext_name) if clean_ext_name else ext_name.strip().replace(" ", "")
-        
-        if not local_is_4k and "4K" in ext_clean:
-            continue
-        
-        ext_cctv_tag = cctv_pattern.search(ext_clean).group(1) if cctv_pattern.search(ext_clean) else None
-        ext_candidate.append({
-            "clean": ext_clean,
-            "tag": ext_cctv_tag,
-            "original": ext_name,
-            "len": len(ext_clean)
-        })
+    # 精确匹配：同名候选是否含"4K"与本地名一致，直接查索引
+    exact = ext_candidates["clean_index"].get(local_clean_name)
+    if exact is not None and (local_is_4k or "4K" not in local_clean_name):
+        return exact["original"]
     
-    for ext in ext_candidate:
-        if local_clean_name == ext["clean"]:
-            return ext["original"]
+    def allowed(ext):
+        return local_is_4k or "4K" not in ext["clean"]
     
     if is_cctv4_europe or is_cctv4_america:
         region_key = "欧洲" if is_cctv4_europe else "美洲"
-        region_matched = [ext for ext in ext_candidate if ext["tag"] == "4" and region_key in ext["clean"]]
+        region_matched = [ext for ext in ext_candidates["tag_index"].get("4", ()) if region_key in ext["clean"] and allowed(ext)]
         if region_matched:
-            region_matched.sort(key=lambda x: x["len"])
-            return region_matched[0]["original"]
+            return min(region_matched, key=lambda x: x["len"])["original"]
     
-    if is_cctv4k:
-        cctv4k_matched = [ext for ext in ext_candidate if "CCTV4K" in ext["clean"]]
-        if cctv4k_matched:
-            cctv4k_matched.sort(key=lambda x: x["len"])
-            return cctv4k_matched[0]["original"]
+    if is_cctv4k and ext_candidates["cctv4k"]:
+        return ext_candidates["cctv4k"]["original"]
     
     if local_cctv_tag:
-        tag_matched = [ext for ext in ext_candidate if ext["tag"] == local_cctv_tag]
+        tag_matched = [ext for ext in ext_candidates["tag_index"].get(local_cctv_tag, ()) if allowed(ext)]
         if tag_matched:
-            tag_matched.sort(key=lambda x: x["len"])
-            return tag_matched[0]["original"]
+            return min(tag_matched, key=lambda x: x["len"])["original"]
     
-    include_matched = [
-        ext for ext in ext_candidate
-        if local_clean_name in ext["clean"] and ext["len"] <= len(local_clean_name) + 10
-    ]
-    if include_matched:
-        include_matched.sort(key=lambda x: x["len"])
-        return include_matched[0]["original"]
+    # 包含匹配：候选长度必在[本地长度, 本地长度+10]内，按长度有序扫描，首个命中即最短
+    by_len = ext_candidates["by_len"]
+    lens = ext_candidates["lens"]
+    local_len = len(local_clean_name)
+    for i in range(bisect.bisect_left(lens, local_len), bisect.bisect_right(lens, local_len + 10)):
+        ext = by_len[i]
+        if local_clean_name in ext["clean"] and allowed(ext):
+            return ext["original"]
     
-    local_no_plus = local_clean_name.replace("+", "")
-    for ext in ext_candidate:
-        ext_no_plus = ext["clean"].replace("+", "")
-        if local_no_plus == ext_no_plus:
+    for ext in ext_candidates["noplus_index"].get(local_clean_name.replace("+", ""), ()):
+        if allowed(ext):
             return ext["original"]
     
     return None
 
 def extract_program_title(prog_elem):
-    title_zh = prog_elem.find(".//title[@lang='zh']")
+    title_zh = prog_elem.find("title[@lang='zh']")
     if title_zh is not None and title_zh.text is not None:
         title = title_zh.text.strip()
         if title:
             return title
     
-    title_any = prog_elem.find(".//title")
+    title_any = prog_elem.find("title")
     if title_any is not None and title_any.text is not None:
         title = title_any.text.strip()
         if title:
@@ -391,72 +800,121 @@ def download_url(url):
     }
     for i in range(EPG_CONFIG['RETRY_TIMES']):
         try:
-            req = urllib.request.Request(url, headers=headers)
-            with urllib.request.urlopen(req, timeout=EPG_CONFIG['TIMEOUT']) as res:
-                if res.status == 200:
-                    return res.read()
-            write_log(f"下载失败：{url} 状态码：{res.status}", "ERROR")
+            status, _, content = http_get(url, headers, EPG_CONFIG['TIMEOUT'])
+            if status == 200:
+                return content
+            write_log(f"下载失败：{url} 状态码：{status}", "ERROR")
         except Exception as e:
             write_log(f"下载重试{i+1}失败：{url} {str(e)}", "ERROR")
     return None
 
-def parse_external_epg(epg_data, is_official=False):
+def download_urls_concurrently(urls):
+    """并发下载多个URL，返回与urls顺序一致的结果列表（失败项为None）"""
+    if not urls:
+        return []
+    max_workers = min(EPG_CONFIG['DOWNLOAD_WORKERS'], len(urls))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(download_url, urls))
+
+def fetch_cached_source(url):
+    """经download_with_cache下载外部源（条件请求；失败时回退旧缓存），返回文件内容，失败返回None
+    超时与重试沿用外部源原来的TIMEOUT/RETRY_TIMES（download_url共尝试RETRY_TIMES次，download_with_cache为重试次数+1次）"""
+    cache_file = download_with_cache(
+        url,
+        EPG_CONFIG['CACHE_DIR'],
+        EPG_CONFIG['TIMEOUT'],
+        max(EPG_CONFIG['RETRY_TIMES'] - 1, 0)
+    )
+    if not cache_file or not os.path.exists(cache_file):
+        return None
+    with open(cache_file, "rb") as f:
+        return f.read()
+
+def parse_external_epg(epg_data, is_official=False, keep_full_programs=True):
+    """keep_full_programs为False时（不保留其他频道）不收集full_program_info，只计数"""
     external_epg_map = {}
     ext_channel_identifiers = []
     id_to_name_map = {}
     full_channel_info = {}
     full_program_info = []
-    
+    full_program_count = 0
+
     try:
-        try:
-            epg_data = gzip.decompress(epg_data)
-        except Exception as e:
-            write_log(f"解压失败（非GZ）：{str(e)}", "EPG_PARSE_WARN")
-        
-        ext_xml = ET.fromstring(epg_data.decode("utf-8", errors="ignore"))
-        
-        for channel in ext_xml.findall(".//channel"):
-            cid = channel.get("id", "")
-            if not cid:
-                continue
-            aliases = [elem.text.strip() for elem in channel.findall("display-name") if elem.text and elem.text.strip()]
-            main_name = aliases[0] if aliases else cid
-            full_channel_info[cid] = {
-                "id": cid,
-                "main_name": main_name,
-                "aliases": aliases
-            }
-            id_to_name_map[cid] = main_name
-            ext_channel_identifiers.append(main_name if not is_official else cid)
-        
-        for prog in ext_xml.findall(".//programme"):
-            cid = prog.get("channel", "")
-            start = prog.get("start")
-            stop = prog.get("stop")
-            if not cid or not start or not stop:
+        # 按GZ魔数判断：GZ数据边解压边交给解析器，不再先整体解压出一份副本
+        # （解压流与非GZ数据一样经下方容错解码后再解析，非法字节不会导致整个源解析失败）
+        if epg_data[:2] == b"\x1f\x8b":
+            epg_source = GZIP_MODULE.open(io.BytesIO(epg_data), "rb")
+        else:
+            write_log("数据非GZ格式，按XML直接解析", "EPG_PARSE_WARN")
+            epg_source = io.BytesIO(epg_data)
+
+        # 流式解析：逐个处理channel/programme后立即清理，避免整棵DOM驻留内存
+        # 第三方源可能夹带非法UTF-8字节：与原先decode("utf-8", errors="ignore")一致，丢弃非法字节后按UTF-8解析
+        raw_programs = []
+        if XML_PARSER is ET:
+            # 标准库：取根节点，每处理完一个元素清空根下已解析的子节点
+            # 传入文本流时expat按UTF-8处理，忽略XML声明中的编码
+            epg_text = io.TextIOWrapper(epg_source, encoding="utf-8", errors="ignore")
+            context = ET.iterparse(epg_text, events=("start", "end"))
+            _, root = next(context)
+
+            def release(elem):
+                root.clear()
+        else:
+            # lxml：只为channel/programme产生end事件，处理后清空该元素并删除其前面的兄弟节点
+            # 数据来自第三方URL：保留libxml2的体积/深度限制，不展开实体、不访问网络（与标准库回退一致）；
+            # recover容忍结构残缺的源（如被截断），尽量保留已解析出的节目，而不是整个源作废
+            context = XML_PARSER.iterparse(
+                Utf8IgnoreReader(epg_source), events=("end",), tag=("channel", "programme"),
+                encoding="utf-8", recover=True, resolve_entities=False, no_network=True
+            )
+
+            def release(elem):
+                elem.clear(keep_tail=True)
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+
+        for event, elem in context:
+            if event != "end":
                 continue
+            if elem.tag == "channel":
+                # 频道ID驻留：同一ID的所有节目共享同一字符串对象，字典/集合查找走身份比较
+                cid = sys.intern(elem.get("id", ""))
+                if cid:
+                    aliases = [dn.text.strip() for dn in elem.findall("display-name") if dn.text and dn.text.strip()]
+                    main_name = aliases[0] if aliases else cid
+                    full_channel_info[cid] = {
+                        "id": cid,
+                        "main_name": main_name,
+                        "aliases": aliases
+                    }
+                    id_to_name_map[cid] = main_name
+                    ext_channel_identifiers.append(main_name if not is_official else cid)
+                release(elem)
+            elif elem.tag == "programme":
+                cid = sys.intern(elem.get("channel", ""))
+                start = elem.get("start")
+                stop = elem.get("stop")
+                if cid and start and stop:
+                    raw_programs.append((cid, start, stop, extract_program_title(elem)))
+                release(elem)
+
+        # 节目可能先于频道定义出现，频道收集完毕后再统一过滤
+        for cid, start, stop, title in raw_programs:
             if cid not in full_channel_info:
                 continue
-            
-            title = extract_program_title(prog)
-            full_program_info.append({
-                "channel_id": cid,
-                "start": start,
-                "stop": stop,
-                "title": title
-            })
+
+            full_program_count += 1
+            if keep_full_programs:
+                full_program_info.append((cid, start, stop, title))
             
             key = cid if is_official else full_channel_info[cid]["main_name"]
             if key not in external_epg_map:
                 external_epg_map[key] = []
-            external_epg_map[key].append({
-                "start": start,
-                "stop": stop,
-                "title": title
-            })
+            external_epg_map[key].append((start, stop, title))
         
         ext_channel_identifiers = list(external_epg_map.keys())
-        write_log(f"EPG解析完成 - 频道{len(full_channel_info)}个（总），匹配用{len(ext_channel_identifiers)}个，节目{len(full_program_info)}条（总）", "EPG_PARSE_DETAIL")
+        write_log(f"EPG解析完成 - 频道{len(full_channel_info)}个（总），匹配用{len(ext_channel_identifiers)}个，节目{full_program_count}条（总）", "EPG_PARSE_DETAIL")
     
     except Exception as e:
         error_info = f"解析失败：{str(e)}\n{traceback.format_exc()}"
@@ -464,22 +922,177 @@ def parse_external_epg(epg_data, is_official=False):
     
     return external_epg_map, ext_channel_identifiers, id_to_name_map, full_channel_info, full_program_info
 
-def generate_unique_ext_channel_id(existing_ids, prefix="ext_"):
-    """生成外部频道的唯一ID（确保不与本地频道ID冲突）"""
-    counter = 1
-    while True:
-        new_id = f"{prefix}{counter}"
+def build_local_channel_rows(matched_channels, unmatched_bjcul_channels, temp_prefix):
+    """生成本地频道的 (频道ID, [显示名]) 行：先ID匹配成功的频道，再外部匹配生成的临时频道
+    返回 (频道行, 名称→ID映射, 匹配频道数, 临时频道数)"""
+    channel_rows = []
+    name_to_id = {}
+    channel_add_count = 0
+    for channel_info in matched_channels.values():
+        local_num = channel_info["local_num"]
+        raw_name = channel_info["raw_name"].strip()
+        channel_rows.append((local_num, [raw_name]))
+        channel_add_count += 1
+        name_to_id[raw_name] = local_num
+    
+    temp_channel_add_count = 0
+    for channel in unmatched_bjcul_channels:
+        if channel["local_num"] and channel["local_num"].startswith(temp_prefix):
+            local_num = channel["local_num"]
+            raw_name = channel["raw_name"].strip()
+            channel_rows.append((local_num, [raw_name]))
+            temp_channel_add_count += 1
+            name_to_id[raw_name] = local_num
+    return channel_rows, name_to_id, channel_add_count, temp_channel_add_count
+
+def get_parsed_cache_path(url, epg_data, is_official, keep_full_programs):
+    """解析结果缓存文件路径：按源URL与源内容（及解析参数）的摘要命名，内容不变即命中"""
+    content_hash = hashlib.blake2b(epg_data, digest_size=16)
+    content_hash.update(f"|{is_official}|{keep_full_programs}|{_PARSED_CACHE_VERSION}".encode("utf-8"))
+    return os.path.join(EPG_CONFIG['CACHE_DIR'], f"parsed_{get_url_hash(url)}_{content_hash.hexdigest()}.pkl")
+
+def parse_external_epg_cached(url, epg_data, is_official=False, keep_full_programs=True):
+    """同parse_external_epg，源内容未变化时直接读取上次的解析结果（pickle），跳过XML解析"""
+    cache_path = get_parsed_cache_path(url, epg_data, is_official, keep_full_programs)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                result = pickle.load(f)
+            write_log(f"命中解析缓存：{cache_path}", "EPG_PARSE_CACHE")
+            return result
+        except Exception as e:
+            write_log(f"读取解析缓存失败：{str(e)}", "EPG_PARSE_WARN")
+
+    result = parse_external_epg(epg_data, is_official, keep_full_programs)
+    if result[0]:
+        try:
+            # 同一源只保留最新一份解析缓存
+            cache_dir = os.path.dirname(cache_path)
+            prefix = f"parsed_{get_url_hash(url)}_"
+            for name in os.listdir(cache_dir):
+                if name.startswith(prefix):
+                    os.remove(os.path.join(cache_dir, name))
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            write_log(f"写入解析缓存失败：{str(e)}", "EPG_PARSE_WARN")
+    return result
+
+def init_parse_worker(config):
+    """进程池子进程初始化：子进程重新导入本模块，同步主进程的运行配置并配置日志"""
+    EPG_CONFIG.update(config)
+    setup_logger()
+
+def get_parse_mp_context():
+    """解析进程池的启动方式：不用fork（创建进程池时下载线程仍在运行，fork会把线程持有的锁复制进子进程导致死锁），
+    优先forkserver，不支持时用spawn"""
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(start_method)
+
+def parse_source_in_worker(url, epg_data, is_official, keep_full_programs):
+    """进程池任务：解析后写出子进程的日志缓冲（子进程退出时不会自动flush）"""
+    try:
+        return parse_external_epg_cached(url, epg_data, is_official, keep_full_programs)
+    finally:
+        flush_log()
+
+class SourcePipeline:
+    """外部源下载→解析流水线：所有源并发下载，某个源下载完成后立即提交到进程池解析（有解析缓存的除外），
+    匹配阶段按源优先级用take()依次取结果，只在该源尚未就绪时等待；等待期间继续为先下载完的源提交解析。
+    进程池任务只在主线程提交；提前结束匹配时close()取消尚未开始的下载与解析"""
+    def __init__(self, sources, keep_full_programs):
+        self.sources = sources
+        self.keep_full_programs = keep_full_programs
+        # 同一URL只下载一次，避免多个线程同时改写同一缓存文件
+        urls = list(dict.fromkeys(source["url"] for source in sources))
+        self.download_pool = ThreadPoolExecutor(max_workers=max(1, min(EPG_CONFIG['DOWNLOAD_WORKERS'], len(urls))))
+        url_futures = {url: self.download_pool.submit(fetch_cached_source, url) for url in urls}
+        self.download_futures = [url_futures[source["url"]] for source in sources]
+        self.unsubmitted = set(range(len(sources)))
+        self.parse_futures = {}
+        self.parse_pool = None
+        # 各源XML解析互不依赖且为CPU密集（线程受GIL限制），源不少于2个时才用进程池并行
+        self.parse_workers = min(EPG_CONFIG['PARSE_WORKERS'], len(sources))
+
+    def _submit_ready_parses(self):
+        """为已下载完成的源提交解析任务"""
+        for idx in sorted(self.unsubmitted):
+            download_future = self.download_futures[idx]
+            if not download_future.done():
+                continue
+            self.unsubmitted.discard(idx)
+            if self.parse_workers < 2 or download_future.cancelled() or download_future.exception():
+                continue
+            epg_data = download_future.result()
+            source = self.sources[idx]
+            is_official = source.get("is_official", False)
+            if not epg_data or os.path.exists(get_parsed_cache_path(source["url"], epg_data, is_official, self.keep_full_programs)):
+                continue
+            try:
+                if self.parse_pool is None:
+                    # 先写出已有日志，子进程的日志排在其后
+                    flush_log()
+                    self.parse_pool = ProcessPoolExecutor(
+                        max_workers=self.parse_workers, mp_context=get_parse_mp_context(),
+                        initializer=init_parse_worker, initargs=(EPG_CONFIG,)
+                    )
+                self.parse_futures[idx] = self.parse_pool.submit(
+                    parse_source_in_worker, source["url"], epg_data, is_official, self.keep_full_programs
+                )
+            except Exception as e:
+                write_log(f"进程池不可用，改为逐个解析：{str(e)}", "EPG_PARSE_WARN")
+                self.parse_workers = 0
+
+    def _wait_for(self, future):
+        """等待future完成，期间有源下载完成就提交其解析"""
+        while not future.done():
+            pending_downloads = {self.download_futures[idx] for idx in self.unsubmitted}
+            wait(pending_downloads | {future}, return_when=FIRST_COMPLETED)
+            self._submit_ready_parses()
+
+    def take(self, idx):
+        """按源序号取 (下载内容, 解析Future)：下载失败内容为None；未提交并行解析时Future为None（由调用方在主进程解析）"""
+        download_future = self.download_futures[idx]
+        self._wait_for(download_future)
+        self._submit_ready_parses()
+        self.download_futures[idx] = None  # 取出后即可释放原始数据
+        try:
+            epg_data = download_future.result()
+        except Exception as e:
+            write_log(f"下载异常：{str(e)}", "STEP4_SOURCE_FAIL")
+            epg_data = None
+        parse_future = self.parse_futures.pop(idx, None)
+        if parse_future is not None:
+            self._wait_for(parse_future)
+        return epg_data, parse_future
+
+    def close(self):
+        self.download_pool.shutdown(wait=False, cancel_futures=True)
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
+
+def get_channel_unique_key(chan):
+    """频道唯一标识（避免重名冲突，用raw_name+rtp_url）"""
+    return f"{chan.get('raw_name', '')}_{chan.get('rtp_url', '')}"
+
+def generate_unique_ext_channel_id(existing_ids, id_counter, prefix="ext_"):
+    """生成外部频道的唯一ID（确保不与本地频道ID冲突）
+    id_counter为整个运行共用的itertools.count，序号只增不减，不必每次从1开始逐个试探"""
+    for counter in id_counter:
+        new_id = sys.intern(f"{prefix}{counter}")
         if new_id not in existing_ids:
             return new_id
-        counter += 1
 
 # ===================== 主函数 =====================
 def epg_main():
     config = EPG_CONFIG
     if os.path.exists(config['LOG_PATH']):
         os.remove(config['LOG_PATH'])
+    setup_logger()
     write_log("="*60 + " EPG生成脚本开始运行 " + "="*60, "START")
-    start_time = datetime.datetime.now()
+    start_perf = time.perf_counter()
     
     if config['PLAYLIST_FORMAT'] not in config['FORMAT_MAPPING']:
         error_msg = f"不支持的格式：{config['PLAYLIST_FORMAT']}，支持：{list(config['FORMAT_MAPPING'].keys())}"
@@ -492,6 +1105,7 @@ def epg_main():
     write_log(f"外部EPG：{'开启' if config['ENABLE_EXTERNAL_EPG'] else '关闭'}", "CONFIG")
     write_log(f"保留其他频道：{'开启' if config['ENABLE_KEEP_OTHER_CHANNELS'] else '关闭'}", "CONFIG")
     
+    ext_id_counter = itertools.count(1)  # 外部频道ID序号（ext_1、ext_2…）
     all_external_channels = {}  # 存储外部频道信息（原始ID→名称/别名）
     all_external_programs = []  # 存储外部节目（原始ID关联）
     ext_id_mapping = {}  # 外部原始ID → 最终频道ID（本地或新生成）
@@ -503,7 +1117,6 @@ def epg_main():
         # 步骤1：读取bjcul.txt
         write_log("开始读取bjcul.txt", "STEP1")
         bjcul_channel_map = {}
-        all_bjcul_rtp_urls = []
         current_category = ""
         # 修复：收集本地txt所有频道名称（用于后续过滤外部同名）
         local_channel_names = set()
@@ -511,38 +1124,40 @@ def epg_main():
         bjcul_local_path = get_local_path(config['BJcul_PATH'])
         valid_line_count = 0
         filtered_line_count = 0
-        with open(bjcul_local_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    filtered_line_count += 1
-                    continue
-                
-                if "#genre#" in line:
-                    current_category = line.replace("#genre#", "").strip().rstrip(',').strip()
-                    write_log(f"识别到分类：{current_category}", "STEP1_CATEGORY")
-                    filtered_line_count += 1
-                    continue
-                
-                if ',' not in line:
-                    filtered_line_count += 1
-                    continue
-                
-                raw_name, rtp_url = line.split(',', 1)
-                raw_name = raw_name.strip()
-                rtp_url = rtp_url.strip()
-                clean_name = clean_channel_name(raw_name)
-                bjcul_channel_map[rtp_url] = {
-                    "raw_name": raw_name,
-                    "clean_name": clean_name,
-                    "category": current_category
-                }
-                all_bjcul_rtp_urls.append(rtp_url)
-                # 修复：添加到本地频道名称集合
-                local_channel_names.add(raw_name)
-                valid_line_count += 1
+        with open(bjcul_local_path, "rb") as f:
+            bjcul_lines = f.read().decode("utf-8").splitlines()
+        for line in bjcul_lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                filtered_line_count += 1
+                continue
+            
+            if "#genre#" in line:
+                current_category = line.replace("#genre#", "").strip().rstrip(',').strip()
+                write_log(f"识别到分类：{current_category}", "STEP1_CATEGORY")
+                filtered_line_count += 1
+                continue
+            
+            # partition一次切分并判断有无逗号，只对两段各strip一次
+            raw_name, sep, rtp_url = line.partition(',')
+            if not sep:
+                filtered_line_count += 1
+                continue
+            
+            raw_name = raw_name.strip()
+            rtp_url = rtp_url.strip()
+            clean_name = clean_channel_name(raw_name)
+            bjcul_channel_map[rtp_url] = {
+                "raw_name": raw_name,
+                "clean_name": clean_name,
+                "category": current_category
+            }
+            # 修复：添加到本地频道名称集合
+            local_channel_names.add(raw_name)
+            valid_line_count += 1
         
-        all_bjcul_rtp_urls = list(set(all_bjcul_rtp_urls))
+        # bjcul_channel_map的键即去重后的RTP地址（保持文件中首次出现的顺序）
+        all_bjcul_rtp_urls = list(bjcul_channel_map)
         total_valid_channels = len(all_bjcul_rtp_urls)
         # 修复：打印本地频道名称数量
         write_log(f"收集本地频道名称：{len(local_channel_names)}个", "STEP1_LOCAL_NAMES")
@@ -555,11 +1170,12 @@ def epg_main():
         unmatched_bjcul_channels = []
         playlist_local_path = get_local_path(config['PLAYLIST_FILE_PATH'])
         
-        with open(playlist_local_path, "r", encoding="utf-8") as f:
-            raw_data = json.load(f)
+        with open(playlist_local_path, "rb") as f:
+            raw_data = JSON_LOADS(f.read())
         
-        channel_items = [(name, info) for name, info in raw_data.items()] if format_config["is_dict_format"] else [(f"channel_{idx}", item) for idx, item in enumerate(raw_data)]
+        channel_items = raw_data.items() if format_config["is_dict_format"] else ((f"channel_{idx}", item) for idx, item in enumerate(raw_data))
         match_success_count = 0
+        url_replace_rule = format_config["url_replace_rule"]
         
         for channel_name, channel_info in channel_items:
             channel_url = get_nested_value(channel_info, format_config["channel_url_path"])
@@ -568,8 +1184,8 @@ def epg_main():
                 continue
             
             rtp_url = channel_url
-            if format_config["url_replace_rule"]:
-                old_str, new_str = format_config["url_replace_rule"]
+            if url_replace_rule:
+                old_str, new_str = url_replace_rule
                 if channel_url.startswith(old_str):
                     rtp_url = channel_url.replace(old_str, new_str, 1)
             
@@ -588,15 +1204,15 @@ def epg_main():
                     "raw_name": bjcul_info["raw_name"],
                     "clean_name": bjcul_info["clean_name"],
                     "category": bjcul_info["category"],
-                    "local_num": str(user_channel_id),
+                    "local_num": sys.intern(str(user_channel_id)),
                     "rtp_url": rtp_url,
                     "channel_name": channel_name
                 }
                 match_success_count += 1
         
-        matched_rtp_urls = [v['rtp_url'] for v in matched_channels.values()]
+        matched_rtp_urls = {v['rtp_url'] for v in matched_channels.values()}
         for rtp_url in all_bjcul_rtp_urls:
-            if rtp_url not in matched_rtp_urls and rtp_url in bjcul_channel_map:
+            if rtp_url not in matched_rtp_urls:
                 bjcul_info = bjcul_channel_map[rtp_url]
                 unmatched_bjcul_channels.append({
                     "type": "unmatched_id",
@@ -613,13 +1229,28 @@ def epg_main():
 
         # 步骤3：处理官方EPG
         write_log("开始处理官方EPG", "STEP3")
-        programme_list = []
+        programme_map = {}  # channel -> {(start, title): (channel, start, stop, title)}
         channel_time_ranges = {}
         official_fail_count = 0
         channel_has_official_prog = set()
         
         if config['ENABLE_OFFICIAL_EPG']:
             datetime_now = datetime.datetime.now()
+            # 日期字符串与URL模板与频道无关，只计算一次
+            date_strs = [
+                (datetime_now + datetime.timedelta(days=day_offset)).strftime("%Y%m%d")
+                for day_offset in range(config['EPG_OFFSET_START'], config['EPG_OFFSET_END'])
+            ]
+            url_template = config['EPG_SERVER_URL'] + "/schedules/{}_{}.json"
+            # 先并发下载所有频道×日期的节目单，再按原顺序串行解析去重
+            official_urls = [
+                url_template.format(channel_code, datestr)
+                for channel_code in matched_channels.keys()
+                for datestr in date_strs
+            ]
+            write_log(f"并发下载官方节目单：{len(official_urls)}个", "STEP3_DOWNLOAD")
+            official_data_map = dict(zip(official_urls, download_urls_concurrently(official_urls)))
+
             for channel_code in matched_channels.keys():
                 channel_info = matched_channels[channel_code]
                 raw_name = channel_info["raw_name"]
@@ -627,34 +1258,24 @@ def epg_main():
                 download_fail = True
                 channel_prog_count = 0
                 
-                for day_offset in range(config['EPG_OFFSET_START'], config['EPG_OFFSET_END']):
-                    datestr = (datetime_now + datetime.timedelta(days=day_offset)).strftime("%Y%m%d")
-                    url = f"{config['EPG_SERVER_URL']}/schedules/{channel_code}_{datestr}.json"
-                    data = download_url(url)
+                for datestr in date_strs:
+                    data = official_data_map.get(url_template.format(channel_code, datestr))
                     if not data:
                         continue
                     
                     try:
-                        epg_data = json.loads(data.decode("utf-8"))
+                        epg_data = JSON_LOADS(data)
                         for schedule in epg_data.get("schedules", []):
                             start_str = schedule.get("starttime", schedule.get("showStarttime", ""))
                             end_str = schedule.get("endtime", start_str)
                             if not start_str or not end_str:
                                 continue
-                            try:
-                                start_time = datetime.datetime.strptime(start_str, "%Y-%m-%d %H:%M:%S")
-                                end_time = datetime.datetime.strptime(end_str, "%Y-%m-%d %H:%M:%S")
-                            except:
+                            prog_start = official_time_to_epg_str(start_str)
+                            prog_stop = official_time_to_epg_str(end_str)
+                            if not prog_start or not prog_stop:
                                 continue
                             title = schedule.get("title", "").strip() or "未知节目"
-                            time_format = "%Y%m%d%H%M%S +0800"
-                            new_prog = {
-                                "channel": local_num,
-                                "start": start_time.strftime(time_format),
-                                "stop": end_time.strftime(time_format),
-                                "title": title
-                            }
-                            if add_program_if_no_time_overlap(programme_list, channel_time_ranges, new_prog):
+                            if add_program_if_no_time_overlap(programme_map, channel_time_ranges, local_num, prog_start, prog_stop, title):
                                 channel_prog_count += 1
                             download_fail = False
                             channel_has_official_prog.add(local_num)
@@ -689,8 +1310,9 @@ def epg_main():
             official_fail_count = len(matched_channels)
         
         total_pending_channels = len(unmatched_bjcul_channels)
-        print(f"[3/7] 官方EPG处理：{len(programme_list)} 条节目（去重后），{official_fail_count} 个需匹配外部源")
-        write_log(f"官方EPG完成 - 节目{len(programme_list)}条（去重后），需外部匹配{official_fail_count}个", "STEP3")
+        official_prog_count = sum(len(channel_progs) for channel_progs in programme_map.values())
+        print(f"[3/7] 官方EPG处理：{official_prog_count} 条节目（去重后），{official_fail_count} 个需匹配外部源")
+        write_log(f"官方EPG完成 - 节目{official_prog_count}条（去重后），需外部匹配{official_fail_count}个", "STEP3")
 
         # 步骤4：多EPG源匹配（修复外部ID冲突）
         write_log("开始多EPG源匹配", "STEP4")
@@ -701,6 +1323,8 @@ def epg_main():
         
         channel_has_external_single = set()
         channel_has_external_multi = set()
+        # 配置KEEP_4K_NAMES转成frozenset，所有外部源的模糊匹配共用
+        keep_4k_names = frozenset(config['KEEP_4K_NAMES'])
         
         if not config['ENABLE_EXTERNAL_EPG']:
             write_log("外部EPG总开关关闭，跳过所有外部源匹配", "STEP4_SKIP_ALL")
@@ -712,209 +1336,173 @@ def epg_main():
             # ========== 新增：初始化全局最终未匹配频道列表 ==========
             # 初始值为所有需要外部匹配的频道（深拷贝，避免修改原列表）
             global_final_unmatched_channels = [channel.copy() for channel in pending_channels]
-            # 用于临时存储每个源匹配成功的频道（后续从全局列表移除）
-            global_matched_channels = []
-            
-            for source_idx, epg_source in enumerate(enabled_sources):
-                if len(pending_channels) == 0:
-                    write_log("无待匹配频道，终止匹配", "STEP4_TERMINATE")
-                    break
+            # 用于临时存储每个源匹配成功的频道唯一标识（后续从全局列表移除）
+            global_matched_keys = set()
+
+            # 已存在的频道ID（本地+临时+已生成的外部ID），在循环中增量维护
+            existing_ids = {v['local_num'] for v in matched_channels.values()}
+
+            # 排除多源的频道/分类在循环内频繁判断，预先取出并转为frozenset
+            exclude_multi_channels = frozenset(config['EXCLUDE_MULTI_SOURCE_CHANNELS'])
+            exclude_multi_categories = frozenset(config['EXCLUDE_MULTI_SOURCE_CATEGORIES'])
+            # 是否排除多源与源无关，每个频道只判断一次并记在频道上
+            for channel in pending_channels:
+                channel["exclude_multi"] = (channel["raw_name"] in exclude_multi_channels
+                                            or channel.get("category", "") in exclude_multi_categories)
+
+            # 所有有效源并发下载，下载完即并行解析；匹配阶段仍按源优先级串行处理
+            source_pipeline = SourcePipeline(enabled_sources, config['ENABLE_KEEP_OTHER_CHANNELS'])
+
+            try:
+                for source_idx, epg_source in enumerate(enabled_sources):
+                    if len(pending_channels) == 0:
+                        write_log("无待匹配频道，终止匹配", "STEP4_TERMINATE")
+                        break
                 
-                source_name = epg_source["name"]
-                source_url = epg_source["url"]
-                is_official = epg_source.get("is_official", False)
-                clean_name = epg_source.get("clean_name", True)
+                    source_name = epg_source["name"]
+                    source_url = epg_source["url"]
+                    is_official = epg_source.get("is_official", False)
+                    clean_name = epg_source.get("clean_name", True)
                 
-                write_log(f"处理第{source_idx+1}个源：{source_name} ({source_url})", "STEP4_SOURCE")
-                print(f"[4/7] 匹配外部源{source_idx+1}：{source_name}（待匹配{len(pending_channels)}个）")
+                    write_log(f"处理第{source_idx+1}个源：{source_name} ({source_url})", "STEP4_SOURCE")
+                    print(f"[4/7] 匹配外部源{source_idx+1}：{source_name}（待匹配{len(pending_channels)}个）")
                 
-                epg_data = download_url(source_url)
-                if not epg_data:
-                    write_log(f"源{source_name}下载失败", "STEP4_SOURCE_FAIL")
-                    continue
+                    epg_data, parse_future = source_pipeline.take(source_idx)
+                    if not epg_data:
+                        write_log(f"源{source_name}下载失败", "STEP4_SOURCE_FAIL")
+                        continue
                 
-                epg_map, epg_identifiers, id_to_name_map, full_channel_info, full_program_info = parse_external_epg(epg_data, is_official)
-                if not epg_map or len(epg_identifiers) == 0:
-                    write_log(f"源{source_name}解析失败", "STEP4_SOURCE_PARSE_FAIL")
-                    continue
+                    parsed_source = None
+                    if parse_future is not None:
+                        try:
+                            parsed_source = parse_future.result()
+                        except Exception as e:
+                            write_log(f"源{source_name}并行解析失败，改为主进程解析：{str(e)}", "EPG_PARSE_WARN")
+                    if parsed_source is None:
+                        parsed_source = parse_external_epg_cached(source_url, epg_data, is_official, config['ENABLE_KEEP_OTHER_CHANNELS'])
+                    epg_map, epg_identifiers, id_to_name_map, full_channel_info, full_program_info = parsed_source
+                    if not epg_map or len(epg_identifiers) == 0:
+                        write_log(f"源{source_name}解析失败", "STEP4_SOURCE_PARSE_FAIL")
+                        continue
 
-                # ===================== 新增：频道重命名逻辑 =====================
-                # 读取当前源的重命名规则
-                channel_rename_rules = epg_source.get("channel_rename", [])
-                if channel_rename_rules and len(channel_rename_rules) > 0:
-                    # 构建重命名映射（原名称→新名称）
-                    rename_map = {}
-                    for old_name, new_name in channel_rename_rules:
-                        if old_name and new_name:  # 跳过空规则
-                            rename_map[old_name.strip()] = new_name.strip()
+                    # ===================== 新增：频道重命名逻辑 =====================
+                    # 读取当前源的重命名规则
+                    channel_rename_rules = epg_source.get("channel_rename", [])
+                    if channel_rename_rules and len(channel_rename_rules) > 0:
+                        # 构建重命名映射（原名称→新名称）
+                        rename_map = {}
+                        for old_name, new_name in channel_rename_rules:
+                            if old_name and new_name:  # 跳过空规则
+                                rename_map[old_name.strip()] = new_name.strip()
                     
-                    if rename_map:
-                        # 1. 处理epg_map（节目映射的频道名）
-                        new_epg_map = {}
-                        for old_key, progs in epg_map.items():
-                            new_key = rename_map.get(old_key, old_key)
-                            if new_key in new_epg_map:
-                                new_epg_map[new_key].extend(progs)
-                            else:
-                                new_epg_map[new_key] = progs
-                        epg_map = new_epg_map
+                        if rename_map:
+                            # 1. 处理epg_map（节目映射的频道名）
+                            new_epg_map = {}
+                            for old_key, progs in epg_map.items():
+                                new_key = rename_map.get(old_key, old_key)
+                                merged_progs = new_epg_map.get(new_key)
+                                if merged_progs is None:
+                                    new_epg_map[new_key] = progs  # 首次出现直接沿用原列表，不复制
+                                else:
+                                    merged_progs.extend(progs)
+                            epg_map = new_epg_map
                         
-                        # 2. 处理频道标识符列表（去重）
-                        new_epg_identifiers = []
-                        for ident in epg_identifiers:
-                            new_ident = rename_map.get(ident, ident)
-                            if new_ident not in new_epg_identifiers:
-                                new_epg_identifiers.append(new_ident)
-                        epg_identifiers = new_epg_identifiers
+                            # 2. 处理频道标识符列表（去重，用集合判重、列表保序）
+                            new_epg_identifiers = []
+                            seen_idents = set()
+                            for ident in epg_identifiers:
+                                new_ident = rename_map.get(ident, ident)
+                                if new_ident not in seen_idents:
+                                    seen_idents.add(new_ident)
+                                    new_epg_identifiers.append(new_ident)
+                            epg_identifiers = new_epg_identifiers
                         
-                        # 3. 处理full_channel_info（频道详情）
-                        for cid, info in full_channel_info.items():
-                            # 重命名主名称
-                            info["main_name"] = rename_map.get(info["main_name"], info["main_name"])
-                            # 重命名别名（去重）
-                            new_aliases = []
-                            for alias in info["aliases"]:
-                                new_alias = rename_map.get(alias, alias)
-                                if new_alias not in new_aliases:
-                                    new_aliases.append(new_alias)
-                            info["aliases"] = new_aliases
+                            # 3. 处理full_channel_info（频道详情）
+                            for cid, info in full_channel_info.items():
+                                # 重命名主名称
+                                info["main_name"] = rename_map.get(info["main_name"], info["main_name"])
+                                # 重命名别名（dict.fromkeys保序去重）
+                                info["aliases"] = list(dict.fromkeys(rename_map.get(alias, alias) for alias in info["aliases"]))
                         
-                        # 4. 处理id_to_name_map（ID→名称映射）
-                        new_id_to_name_map = {}
-                        for cid, old_name in id_to_name_map.items():
-                            new_id_to_name_map[cid] = rename_map.get(old_name, old_name)
-                        id_to_name_map = new_id_to_name_map
+                            # 4. 处理id_to_name_map（ID→名称映射）
+                            id_to_name_map = {cid: rename_map.get(old_name, old_name) for cid, old_name in id_to_name_map.items()}
                         
-                        write_log(f"{source_name}完成频道重命名，生效规则数：{len(rename_map)}", "STEP4_RENAME")
-                # ===================== 新增结束 =====================
-                
-                if config['ENABLE_KEEP_OTHER_CHANNELS']:
-                    # 收集所有已存在的频道ID（本地+临时+已生成的外部ID）
-                    matched_local_nums = [v['local_num'] for v in matched_channels.values()]
-                    temp_local_nums = [c['local_num'] for c in unmatched_bjcul_channels if c['local_num'] and c['local_num'].startswith(temp_local_num_prefix)]
-                    existing_ids = set(matched_local_nums + temp_local_nums + list(ext_id_mapping.values()))
+                            write_log(f"{source_name}完成频道重命名，生效规则数：{len(rename_map)}", "STEP4_RENAME")
+                    # ===================== 新增结束 =====================
                 
-                    # 处理外部频道：强制生成独立ID，仅按名称去重
-                    for ext_raw_cid, channel_info in full_channel_info.items():
-                        ext_main_name = channel_info["main_name"].strip()
-                        ext_aliases = channel_info["aliases"]
+                    if config['ENABLE_KEEP_OTHER_CHANNELS']:
+                        # 处理外部频道：强制生成独立ID，仅按名称去重
+                        for ext_raw_cid, channel_info in full_channel_info.items():
+                            ext_main_name = channel_info["main_name"].strip()
+                            ext_aliases = channel_info["aliases"]
                         
-                        # 1. 先检查名称是否已存在（外部源之间的同名）
-                        if ext_main_name in ext_channel_name_to_final_id:
-                            # 名称已存在，关联到已有ID
-                            final_id = ext_channel_name_to_final_id[ext_main_name]
-                            ext_id_mapping[ext_raw_cid] = final_id
-                            write_log(f"外部频道名称[{ext_main_name}]已存在（跨源），关联到ID[{final_id}]（外部原始ID：{ext_raw_cid}）", "STEP4_NAME_DUP")
-                            continue
+                            # 1. 先检查名称是否已存在（外部源之间的同名）
+                            if ext_main_name in ext_channel_name_to_final_id:
+                                # 名称已存在，关联到已有ID
+                                final_id = ext_channel_name_to_final_id[ext_main_name]
+                                ext_id_mapping[ext_raw_cid] = final_id
+                                write_log(f"外部频道名称[{ext_main_name}]已存在（跨源），关联到ID[{final_id}]（外部原始ID：{ext_raw_cid}）", "STEP4_NAME_DUP")
+                                continue
                         
-                        # 2. 名称不存在，生成新的唯一ID（避免与本地冲突）
-                        new_ext_id = generate_unique_ext_channel_id(existing_ids)
-                        ext_id_mapping[ext_raw_cid] = new_ext_id
-                        ext_channel_name_to_final_id[ext_main_name] = new_ext_id
-                        existing_ids.add(new_ext_id)
+                            # 2. 名称不存在，生成新的唯一ID（避免与本地冲突）
+                            new_ext_id = generate_unique_ext_channel_id(existing_ids, ext_id_counter)
+                            ext_id_mapping[ext_raw_cid] = new_ext_id
+                            ext_channel_name_to_final_id[ext_main_name] = new_ext_id
+                            existing_ids.add(new_ext_id)
                         
-                        # 3. 存储外部频道信息
-                        all_external_channels[ext_raw_cid] = {
-                            "original_id": ext_raw_cid,
-                            "final_id": new_ext_id,
-                            "main_name": ext_main_name,
-                            "aliases": ext_aliases
-                        }
-                        # 修复：同步更新外部最终ID→信息映射
-                        ext_final_id_to_info[new_ext_id] = all_external_channels[ext_raw_cid]
-                        write_log(f"新增外部频道：名称[{ext_main_name}]，生成独立ID[{new_ext_id}]（外部原始ID：{ext_raw_cid}）", "STEP4_NEW_EXT_CHANNEL")
+                            # 3. 存储外部频道信息
+                            all_external_channels[ext_raw_cid] = {
+                                "original_id": ext_raw_cid,
+                                "final_id": new_ext_id,
+                                "main_name": ext_main_name,
+                                "aliases": ext_aliases
+                            }
+                            # 修复：同步更新外部最终ID→信息映射
+                            ext_final_id_to_info[new_ext_id] = all_external_channels[ext_raw_cid]
+                            write_log(f"新增外部频道：名称[{ext_main_name}]，生成独立ID[{new_ext_id}]（外部原始ID：{ext_raw_cid}）", "STEP4_NEW_EXT_CHANNEL")
                 
-                    # 处理外部节目：关联到最终ID（本地或新生成的外部ID）
-                    for prog in full_program_info:
-                        ext_raw_cid = prog["channel_id"]
-                        final_cid = ext_id_mapping.get(ext_raw_cid, None)
-                        if not final_cid:
-                            continue  # 未找到有效ID，跳过
-                        all_external_programs.append({
-                            "channel": final_cid,
-                            "start": prog["start"],
-                            "stop": prog["stop"],
-                            "title": prog["title"]
-                        })
+                        # 处理外部节目：关联到最终ID（本地或新生成的外部ID）
+                        for ext_raw_cid, start, stop, title in full_program_info:
+                            final_cid = ext_id_mapping.get(ext_raw_cid, None)
+                            if not final_cid:
+                                continue  # 未找到有效ID，跳过
+                            all_external_programs.append((final_cid, start, stop, title))
                 
-                matched_in_this_source = 0
-                # ========== 新增：初始化当前源未匹配频道列表 ==========
-                source_unmatched_channels = []  # 存储当前源完全未匹配的频道
-                next_pending_channels = []
+                    # 外部频道名每个源只清洗一次，所有待匹配频道共用
+                    ext_candidates = build_ext_candidates(epg_identifiers, clean_name)
+                    # 同一源内清洗名相同的本地频道匹配结果一致，按清洗名缓存
+                    match_cache = {}
+                    matched_in_this_source = 0
+                    # ========== 新增：初始化当前源未匹配频道列表 ==========
+                    source_unmatched_channels = []  # 存储当前源完全未匹配的频道
+                    next_pending_channels = []
                 
-                for channel in pending_channels:
-                    clean_name_local = channel["clean_name"]
-                    raw_name = channel["raw_name"]
-                    local_num = channel["local_num"]
-                    channel_category = channel.get("category", "")
-                    channel_matched = False
+                    for channel in pending_channels:
+                        clean_name_local = channel["clean_name"]
+                        raw_name = channel["raw_name"]
+                        local_num = channel["local_num"]
+                        channel_category = channel.get("category", "")
+                        channel_matched = False
+                        is_exclude_multi = channel["exclude_multi"]
                     
-                    skip_current_source = False
-                    if local_num in channel_has_official_prog:
-                        write_log(f"{raw_name}已获取官方节目，跳过当前源补充", "STEP4_SKIP_OFFICIAL")
-                        skip_current_source = True
-                    elif (
-                        (raw_name in config['EXCLUDE_MULTI_SOURCE_CHANNELS'] or channel_category in config['EXCLUDE_MULTI_SOURCE_CATEGORIES'])
-                        and local_num in channel_has_external_single
-                    ):
-                        write_log(f"{raw_name}（分类：{channel_category}）为排除多源频道且已获取外部节目，跳过当前源补充", "STEP4_SKIP_SINGLE")
-                        skip_current_source = True
+                        skip_current_source = False
+                        if local_num in channel_has_official_prog:
+                            write_log(f"{raw_name}已获取官方节目，跳过当前源补充", "STEP4_SKIP_OFFICIAL")
+                            skip_current_source = True
+                        elif is_exclude_multi and local_num in channel_has_external_single:
+                            write_log(f"{raw_name}（分类：{channel_category}）为排除多源频道且已获取外部节目，跳过当前源补充", "STEP4_SKIP_SINGLE")
+                            skip_current_source = True
                     
-                    if skip_current_source:
-                        if not (raw_name in config['EXCLUDE_MULTI_SOURCE_CHANNELS'] or channel_category in config['EXCLUDE_MULTI_SOURCE_CATEGORIES']):
-                            next_pending_channels.append(channel)
-                        continue
-                    
-                    is_exclude_multi = (
-                        raw_name in config['EXCLUDE_MULTI_SOURCE_CHANNELS'] 
-                        or channel_category in config['EXCLUDE_MULTI_SOURCE_CATEGORIES']
-                    )
+                        if skip_current_source:
+                            if not is_exclude_multi:
+                                next_pending_channels.append(channel)
+                            continue
                     
-                    if is_official and local_num and not local_num.startswith(temp_local_num_prefix):
-                        if local_num in epg_identifiers and epg_map.get(local_num):
-                            ext_channel_name = id_to_name_map.get(local_num, f"ID_{local_num}")
-                            ext_progs = epg_map[local_num]
-                            new_prog_count = 0
-                            for prog in ext_progs:
-                                new_prog = {
-                                    "channel": local_num,
-                                    "start": prog["start"],
-                                    "stop": prog["stop"],
-                                    "title": prog["title"]
-                                }
-                                if add_program_if_no_time_overlap(programme_list, channel_time_ranges, new_prog):
-                                    new_prog_count += 1
-                            if new_prog_count > 0:
-                                matched_in_this_source += 1
-                                total_matched_by_external += 1
-                                if is_exclude_multi:
-                                    channel_has_external_single.add(local_num)
-                                else:
-                                    channel_has_external_multi.add(local_num)
-                                write_log(f"{raw_name}({local_num})从{source_name}补充{new_prog_count}条节目（去重后）", "STEP4_MATCH_SUCCESS")
-                                channel_matched = True
-                                # ========== 新增：收集全局匹配成功的频道 ==========
-                                global_matched_channels.append(channel.copy())
-                    else:
-                        match_ext_name = fuzzy_match(clean_name_local, epg_identifiers, clean_name)
-                        if match_ext_name and match_ext_name in epg_map:
-                            ext_progs = epg_map[match_ext_name]
-                            if ext_progs:
-                                if not local_num:
-                                    local_num = f"{temp_local_num_prefix}{temp_num_counter}"
-                                    temp_num_counter += 1
-                                    channel["local_num"] = local_num
-                                
-                                new_prog_count = 0
-                                for prog in ext_progs:
-                                    new_prog = {
-                                        "channel": local_num,
-                                        "start": prog["start"],
-                                        "stop": prog["stop"],
-                                        "title": prog["title"]
-                                    }
-                                    if add_program_if_no_time_overlap(programme_list, channel_time_ranges, new_prog):
-                                        new_prog_count += 1
+                        if is_official and local_num and not local_num.startswith(temp_local_num_prefix):
+                            if local_num in epg_identifiers and epg_map.get(local_num):
+                                ext_channel_name = id_to_name_map.get(local_num, f"ID_{local_num}")
+                                ext_progs = epg_map[local_num]
+                                new_prog_count = add_programs_if_no_time_overlap(programme_map, channel_time_ranges, local_num, ext_progs)
                                 if new_prog_count > 0:
                                     matched_in_this_source += 1
                                     total_matched_by_external += 1
@@ -924,57 +1512,80 @@ def epg_main():
                                         channel_has_external_multi.add(local_num)
                                     write_log(f"{raw_name}({local_num})从{source_name}补充{new_prog_count}条节目（去重后）", "STEP4_MATCH_SUCCESS")
                                     channel_matched = True
-                                # ========== 新增：收集全局匹配成功的频道 ==========
-                                global_matched_channels.append(channel.copy())
+                                    # ========== 新增：收集全局匹配成功的频道 ==========
+                                    global_matched_keys.add(get_channel_unique_key(channel))
                         else:
-                            # ========== 新增：当前源未匹配，加入未匹配列表 ==========
-                            source_unmatched_channels.append(channel)
+                            if clean_name_local in match_cache:
+                                match_ext_name = match_cache[clean_name_local]
+                            else:
+                                match_ext_name = fuzzy_match(clean_name_local, ext_candidates, keep_4k_names)
+                                match_cache[clean_name_local] = match_ext_name
+                            if match_ext_name and match_ext_name in epg_map:
+                                ext_progs = epg_map[match_ext_name]
+                                if ext_progs:
+                                    if not local_num:
+                                        local_num = sys.intern(f"{temp_local_num_prefix}{temp_num_counter}")
+                                        temp_num_counter += 1
+                                        channel["local_num"] = local_num
+                                        existing_ids.add(local_num)
+                                
+                                    new_prog_count = add_programs_if_no_time_overlap(programme_map, channel_time_ranges, local_num, ext_progs)
+                                    if new_prog_count > 0:
+                                        matched_in_this_source += 1
+                                        total_matched_by_external += 1
+                                        if is_exclude_multi:
+                                            channel_has_external_single.add(local_num)
+                                        else:
+                                            channel_has_external_multi.add(local_num)
+                                        write_log(f"{raw_name}({local_num})从{source_name}补充{new_prog_count}条节目（去重后）", "STEP4_MATCH_SUCCESS")
+                                        channel_matched = True
+                                    # ========== 新增：收集全局匹配成功的频道 ==========
+                                    global_matched_keys.add(get_channel_unique_key(channel))
+                            else:
+                                # ========== 新增：当前源未匹配，加入未匹配列表 ==========
+                                source_unmatched_channels.append(channel)
                     
-                    if not is_exclude_multi:
-                        next_pending_channels.append(channel)
-                    else:
-                        if not channel_matched:
+                        if not is_exclude_multi:
                             next_pending_channels.append(channel)
                         else:
-                            write_log(f"{raw_name}（分类：{channel_category}）为排除多源频道，匹配成功后不再参与后续源", "STEP4_EXCLUDE_MULTI")
-
-                pending_channels = next_pending_channels
-                write_log(f"{source_name}匹配完成 - 补充{matched_in_this_source}个频道的节目，剩余{len(pending_channels)}个待补充", "STEP4_SOURCE_SUMMARY")
-                print(f"  → 源{source_idx+1}补充{matched_in_this_source}个频道的节目，剩余{len(pending_channels)}个待补充")
-
-                # ========== 新增：输出当前源未匹配频道列表 ==========
-                if len(source_unmatched_channels) > 0:
-                    write_log(f"=== 源{source_idx+1}完全未匹配频道明细（共{len(source_unmatched_channels)}个）===", "STEP4_SOURCE_UNMATCHED")
-                    for idx, unmatch_channel in enumerate(source_unmatched_channels, 1):
-                        raw_name = unmatch_channel.get("raw_name", "未知名称")
-                        category = unmatch_channel.get("category", "未知分类")
-                        local_num = unmatch_channel.get("local_num", "无本地ID")
-                        log_content = f"[{idx}] 名称：{raw_name} | 分类：{category} | 本地ID：{local_num}"
-                        write_log(log_content, "STEP4_UNMATCHED_ITEM")
-                    write_log("=== 未匹配频道明细结束 ===", "STEP4_SOURCE_UNMATCHED")
-    
-                    # 控制台输出简洁版（前20个）
-                    unmatch_names = [c.get("raw_name", "未知") for c in source_unmatched_channels]
-                    print(f"  → 源{source_idx+1}完全未匹配频道：{unmatch_names[:20]}{'...' if len(unmatch_names) > 20 else ''}")
-                else:
-                    print(f"  → 源{source_idx+1}无完全未匹配频道")
-
-                # ========== 新增：从全局最终未匹配列表中，移除当前源匹配成功的频道 ==========
-                # 定义频道唯一标识（避免重名冲突，用raw_name+rtp_url）
-                def get_channel_unique_key(chan):
-                    return f"{chan.get('raw_name', '')}_{chan.get('rtp_url', '')}"
+                            if not channel_matched:
+                                next_pending_channels.append(channel)
+                            else:
+                                write_log(f"{raw_name}（分类：{channel_category}）为排除多源频道，匹配成功后不再参与后续源", "STEP4_EXCLUDE_MULTI")
 
-                # 提取当前源匹配成功的频道唯一标识
-                matched_keys = [get_channel_unique_key(chan) for chan in global_matched_channels]
-                # 筛选全局未匹配列表，移除已匹配的频道
-                global_final_unmatched_channels = [
-                    chan for chan in global_final_unmatched_channels
-                    if get_channel_unique_key(chan) not in matched_keys
-                ]
-                # 清空当前源匹配列表，为下一个源做准备
-                global_matched_channels.clear()
+                    pending_channels = next_pending_channels
+                    write_log(f"{source_name}匹配完成 - 补充{matched_in_this_source}个频道的节目，剩余{len(pending_channels)}个待补充", "STEP4_SOURCE_SUMMARY")
+                    print(f"  → 源{source_idx+1}补充{matched_in_this_source}个频道的节目，剩余{len(pending_channels)}个待补充")
 
+                    # ========== 新增：输出当前源未匹配频道列表 ==========
+                    if len(source_unmatched_channels) > 0:
+                        write_log(f"=== 源{source_idx+1}完全未匹配频道明细（共{len(source_unmatched_channels)}个）===", "STEP4_SOURCE_UNMATCHED")
+                        for idx, unmatch_channel in enumerate(source_unmatched_channels, 1):
+                            raw_name = unmatch_channel.get("raw_name", "未知名称")
+                            category = unmatch_channel.get("category", "未知分类")
+                            local_num = unmatch_channel.get("local_num", "无本地ID")
+                            log_content = f"[{idx}] 名称：{raw_name} | 分类：{category} | 本地ID：{local_num}"
+                            write_log(log_content, "STEP4_UNMATCHED_ITEM")
+                        write_log("=== 未匹配频道明细结束 ===", "STEP4_SOURCE_UNMATCHED")
+    
+                        # 控制台输出简洁版（前20个）
+                        unmatch_names = [c.get("raw_name", "未知") for c in source_unmatched_channels]
+                        print(f"  → 源{source_idx+1}完全未匹配频道：{unmatch_names[:20]}{'...' if len(unmatch_names) > 20 else ''}")
+                    else:
+                        print(f"  → 源{source_idx+1}无完全未匹配频道")
 
+                    # ========== 新增：从全局最终未匹配列表中，移除当前源匹配成功的频道 ==========
+                    # 匹配时已直接记录唯一标识（集合，过滤时O(1)判断），筛选全局未匹配列表，移除已匹配的频道
+                    if global_matched_keys:
+                        global_final_unmatched_channels = [
+                            chan for chan in global_final_unmatched_channels
+                            if get_channel_unique_key(chan) not in global_matched_keys
+                        ]
+                    # 清空当前源匹配集合，为下一个源做准备
+                    global_matched_keys.clear()
+            finally:
+                # 提前终止或出错时取消尚未开始的下载与解析任务并关闭线程池/进程池
+                source_pipeline.close()
 
         total_unmatched_final = len(pending_channels)
         print(f"[5/7] 多源匹配完成：总计{total_matched_by_external}个，剩余{total_unmatched_final}个未匹配")
@@ -1005,91 +1616,41 @@ def epg_main():
 
         # 步骤5：生成XML（修复外部ID冲突+漏加问题）
         write_log("开始生成精简版EPG XML", "STEP5_LITE")
-        root_lite = ET.Element("tv", {
-            "generator-info-name": "MY EPG Generator v4.1 (Lite)",
-            "generator-info-url": "https://github.com/jackycher/my-epg-generator",
-            "generated-time": "UTC" + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        
-        channel_add_count = 0
-        # 收集本地频道名称→ID映射（用于完整版名称去重）
-        local_channel_name_to_id = {}
-        for channel_code in matched_channels.keys():
-            channel_info = matched_channels[channel_code]
-            local_num = channel_info["local_num"]
-            raw_name = channel_info["raw_name"].strip()
-            channel_elem = ET.SubElement(root_lite, "channel", {"id": local_num})
-            ET.SubElement(channel_elem, "display-name", {"lang": "zh"}).text = raw_name
-            channel_add_count += 1
-            local_channel_name_to_id[raw_name] = local_num  # 本地名称→ID映射
-        
-        temp_channel_add_count = 0
-        for channel in unmatched_bjcul_channels:
-            if channel["local_num"] and channel["local_num"].startswith(temp_local_num_prefix):
-                local_num = channel["local_num"]
-                raw_name = channel["raw_name"].strip()
-                channel_elem = ET.SubElement(root_lite, "channel", {"id": local_num})
-                ET.SubElement(channel_elem, "display-name", {"lang": "zh"}).text = raw_name
-                temp_channel_add_count += 1
-                local_channel_name_to_id[raw_name] = local_num  # 临时频道名称→ID映射
+        # 本地频道行（精简版/完整版共用），并收集本地频道名称→ID映射（用于完整版名称去重）
+        lite_channels, local_channel_name_to_id, channel_add_count, temp_channel_add_count = build_local_channel_rows(
+            matched_channels, unmatched_bjcul_channels, temp_local_num_prefix
+        )
         
-        seen_progs_lite = set()
-        sorted_progs_lite = sorted(programme_list, key=lambda x: (x["channel"], x["start"]))
-        prog_add_count_lite = 0
-        non_unknown_count_lite = 0
+        # 精简版/完整版共用同一生成时间
+        generated_time = "UTC" + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # 节目表插入时已按 (channel, start, title) 去重，这里只需按频道分组排序
+        sorted_progs_lite = sort_programme_map(programme_map)
         
-        for prog in sorted_progs_lite:
-            if not prog.get("channel") or not prog.get("start") or not prog.get("title"):
-                continue
-            key = (prog["channel"], prog["start"], prog["title"])
-            if key in seen_progs_lite:
-                continue
-            seen_progs_lite.add(key)
-            
-            prog_elem = ET.SubElement(root_lite, "programme", {
-                "start": prog["start"],
-                "stop": prog["stop"],
-                "channel": prog["channel"]
-            })
-            ET.SubElement(prog_elem, "title", {"lang": "zh"}).text = prog["title"]
-            prog_add_count_lite += 1
-            if prog["title"] != "未知节目":
-                non_unknown_count_lite += 1
-        
-        ET.ElementTree(root_lite).write(
+        prog_add_count_lite, non_unknown_count_lite = write_epg_xml(
             config['EPG_SAVE_PATH'],
-            encoding="UTF-8",
-            xml_declaration=True,
-            short_empty_elements=False
+            config['EPG_GZ_PATH'],
+            "MY EPG Generator v4.1 (Lite)",
+            generated_time,
+            lite_channels,
+            iter_valid_programmes(sorted_progs_lite)
         )
         os.chmod(config['EPG_SAVE_PATH'], 0o644)
         print(f"[6/7] 生成精简版EPG：{config['EPG_SAVE_PATH']}（{prog_add_count_lite}条节目）")
         write_log(f"精简版XML生成成功：{config['EPG_SAVE_PATH']}，总频道{channel_add_count + temp_channel_add_count}个（txt{channel_add_count} + 临时{temp_channel_add_count}）", "STEP5_LITE")
         
-        print("[6/7] 压缩精简版为epg.xml.gz...")
-        compress_xml_to_gz(config['EPG_SAVE_PATH'], config['EPG_GZ_PATH'])
+        report_gz_ratio(config['EPG_SAVE_PATH'], config['EPG_GZ_PATH'])
 
         other_channel_add_count = 0
         prog_add_count_full = 0
         non_unknown_count_full = 0
         if config['ENABLE_KEEP_OTHER_CHANNELS'] and ext_channel_name_to_final_id:  # 修复：判断是否有外部频道
             write_log("开始生成完整版EPG XML", "STEP5_FULL")
-            root_full = ET.Element("tv", {
-                "generator-info-name": "MY EPG Generator v4.1 (Full)",
-                "generator-info-url": "https://github.com/jackycher/my-epg-generator",
-                "generated-time": "UTC" + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-            
             # 复制精简版的频道到完整版
-            for channel_elem in root_lite.findall(".//channel"):
-                new_channel = ET.SubElement(root_full, "channel", {"id": channel_elem.get("id")})
-                for dn_elem in channel_elem.findall(".//display-name"):
-                    dn_text = dn_elem.text.strip()
-                    ET.SubElement(new_channel, "display-name", {"lang": "zh"}).text = dn_text
+            full_channels = list(lite_channels)
             
             # 合并本地+外部的名称→ID映射（用于最终名称去重）
             final_channel_name_to_id = local_channel_name_to_id.copy()
-            existing_channel_ids = set([c.get("id") for c in root_full.findall(".//channel")])
+            existing_channel_ids = {channel_id for channel_id, _ in full_channels}
             
             # 修复：遍历去重后的外部频道名称→ID，仅过滤本地同名频道
             for ext_main_name, ext_final_id in ext_channel_name_to_final_id.items():
@@ -1101,7 +1662,7 @@ def epg_main():
                 # 确保ID不冲突（双重保障）
                 if ext_final_id in existing_channel_ids:
                     write_log(f"外部频道最终ID[{ext_final_id}]冲突，重新生成ID（名称：{ext_main_name}）", "STEP5_FULL_ID_CONFLICT")
-                    ext_final_id = generate_unique_ext_channel_id(existing_channel_ids)
+                    ext_final_id = generate_unique_ext_channel_id(existing_channel_ids, ext_id_counter)
                 
                 # 获取频道信息
                 channel_info = ext_final_id_to_info.get(ext_final_id)
@@ -1110,13 +1671,13 @@ def epg_main():
                     continue
                 
                 # 添加外部频道
-                channel_elem = ET.SubElement(root_full, "channel", {"id": ext_final_id})
-                ET.SubElement(channel_elem, "display-name", {"lang": "zh"}).text = ext_main_name
-                for alias in channel_info["aliases"][1:]:
+                display_names = [ext_main_name]
+                for alias in itertools.islice(channel_info["aliases"], 1, None):
                     alias_text = alias.strip()
                     # 别名也过滤本地同名
                     if alias_text not in local_channel_names and alias_text not in final_channel_name_to_id:
-                        ET.SubElement(channel_elem, "display-name", {"lang": "zh"}).text = alias_text
+                        display_names.append(alias_text)
+                full_channels.append((ext_final_id, display_names))
                 
                 # 更新映射和ID集合
                 final_channel_name_to_id[ext_main_name] = ext_final_id
@@ -1126,57 +1687,29 @@ def epg_main():
             
             write_log(f"添加外部源其他频道：{other_channel_add_count}个（过滤{len(ext_channel_name_to_final_id)-other_channel_add_count}个本地同名频道）", "STEP5_FULL_CHANNELS")
             
-            # 收集所有节目（本地+外部）
-            all_programs_full = []
-            all_programs_full.extend(programme_list)
-            all_programs_full.extend(all_external_programs)
-            
-            # 过滤有效节目并排序
-            valid_progs_full = []
-            for prog in all_programs_full:
-                if isinstance(prog, dict) and "channel" in prog and "start" in prog and "title" in prog and prog["channel"] in existing_channel_ids:
-                    valid_progs_full.append(prog)
-            
-            sorted_progs_full = sorted(valid_progs_full, key=lambda x: (x["channel"], x["start"]))
-            
-            # 去重并添加节目
-            seen_progs_full = set()
-            for prog in sorted_progs_full:
-                if not prog.get("channel") or not prog.get("start") or not prog.get("title"):
-                    continue
-                key = (prog["channel"], prog["start"], prog["title"])
-                if key in seen_progs_full:
-                    continue
-                seen_progs_full.add(key)
-                
-                prog_elem = ET.SubElement(root_full, "programme", {
-                    "start": prog["start"],
-                    "stop": prog["stop"],
-                    "channel": prog["channel"]
-                })
-                ET.SubElement(prog_elem, "title", {"lang": "zh"}).text = prog["title"]
-                prog_add_count_full += 1
-                if prog["title"] != "未知节目":
-                    non_unknown_count_full += 1
+            # 本地节目已按 (channel, start) 排好序，只需单独排序外部节目后归并（同键时本地在前）
+            sorted_ext_progs = sorted(all_external_programs, key=itemgetter(0, 1))
             
-            ET.ElementTree(root_full).write(
+            # 归并、过滤、去重以生成器串联，直接写入文件，不生成中间列表
+            merged_progs_full = heapq.merge(sorted_progs_lite, sorted_ext_progs, key=itemgetter(0, 1))
+            prog_add_count_full, non_unknown_count_full = write_epg_xml(
                 config['EPG_FULL_SAVE_PATH'],
-                encoding="UTF-8",
-                xml_declaration=True,
-                short_empty_elements=False
+                config['EPG_FULL_GZ_PATH'],
+                "MY EPG Generator v4.1 (Full)",
+                generated_time,
+                full_channels,
+                iter_valid_programmes(merged_progs_full, existing_channel_ids, dedup=True)
             )
             os.chmod(config['EPG_FULL_SAVE_PATH'], 0o644)
             print(f"[6/7] 生成完整版EPG：{config['EPG_FULL_SAVE_PATH']}（去重后{prog_add_count_full}条，新增外部频道{other_channel_add_count}个）")
             write_log(f"完整版XML生成成功：{config['EPG_FULL_SAVE_PATH']}，总频道{channel_add_count + temp_channel_add_count + other_channel_add_count}个", "STEP5_FULL")
             
-            print("[6/7] 压缩完整版为epg_full.xml.gz...")
-            compress_xml_to_gz(config['EPG_FULL_SAVE_PATH'], config['EPG_FULL_GZ_PATH'])
+            report_gz_ratio(config['EPG_FULL_SAVE_PATH'], config['EPG_FULL_GZ_PATH'])
         else:
             write_log("未开启保留其他频道或无外部频道，跳过完整版生成", "STEP5_FULL_SKIP")
 
         write_log("统计运行结果", "STEP6")
-        end_time = datetime.datetime.now()
-        run_duration = (end_time - start_time).total_seconds()
+        run_duration = time.perf_counter() - start_perf
         
         summary = {
             "总耗时(秒)": round(run_duration, 2),
@@ -1205,6 +1738,8 @@ def epg_main():
         print(f"❌ EPG运行异常：{str(e)}")
         print(f"详细日志：{config['LOG_PATH']}")
         sys.exit(1)
+    finally:
+        close_http_sessions()
 
 if __name__ == "__main__":
     print("="*60)
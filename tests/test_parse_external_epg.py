@@ -0,0 +1,76 @@
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import epg_generator  # noqa: E402
+
+# 节目标题中夹带一个非法UTF-8字节（\xff）
+BAD_BYTE_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<tv>'
+    '<channel id="CCTV1"><display-name lang="zh">CCTV1</display-name></channel>'
+    '<programme channel="CCTV1" start="20260101080000 +0800" stop="20260101090000 +0800">'
+    '<title lang="zh">新BAD闻联播</title></programme>'
+    '<programme channel="CCTV1" start="20260101090000 +0800" stop="20260101100000 +0800">'
+    '<title lang="zh">天气预报</title></programme>'
+    '</tv>'
+).encode("utf-8").replace(b"BAD", b"\xff")
+
+EXPECTED_PROGRAMS = [
+    ("20260101080000 +0800", "20260101090000 +0800", "新闻联播"),
+    ("20260101090000 +0800", "20260101100000 +0800", "天气预报"),
+]
+
+
+class ParseExternalEpgInvalidUtf8Test(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.config_patch = mock.patch.dict(
+            epg_generator.EPG_CONFIG, {"LOG_PATH": os.path.join(cls.tmp_dir.name, "epg_run.log")}
+        )
+        cls.config_patch.start()
+        epg_generator.setup_logger()
+
+    @classmethod
+    def tearDownClass(cls):
+        for handler in list(epg_generator._LOGGER.handlers):
+            epg_generator._LOGGER.removeHandler(handler)
+            handler.close()
+        cls.config_patch.stop()
+        cls.tmp_dir.cleanup()
+
+    def assert_invalid_byte_dropped(self, epg_data):
+        epg_map, identifiers, _, _, full_program_info = epg_generator.parse_external_epg(epg_data)
+        self.assertEqual(identifiers, ["CCTV1"])
+        self.assertEqual(epg_map["CCTV1"], EXPECTED_PROGRAMS)
+        self.assertEqual(len(full_program_info), 2)
+
+    def test_invalid_byte_is_ignored(self):
+        self.assert_invalid_byte_dropped(BAD_BYTE_XML)
+
+    def test_invalid_byte_is_ignored_with_stdlib_parser(self):
+        with mock.patch.object(epg_generator, "XML_PARSER", epg_generator.ET):
+            self.assert_invalid_byte_dropped(BAD_BYTE_XML)
+
+    def test_invalid_byte_in_gz_feed_is_ignored(self):
+        self.assert_invalid_byte_dropped(gzip.compress(BAD_BYTE_XML))
+
+    def test_invalid_byte_in_gz_feed_is_ignored_with_stdlib_parser(self):
+        with mock.patch.object(epg_generator, "XML_PARSER", epg_generator.ET):
+            self.assert_invalid_byte_dropped(gzip.compress(BAD_BYTE_XML))
+
+
+    @unittest.skipIf(epg_generator.XML_PARSER is epg_generator.ET, "lxml未安装")
+    def test_truncated_feed_keeps_parsed_programmes_with_lxml(self):
+        truncated = BAD_BYTE_XML[:BAD_BYTE_XML.index(b"</tv>")]
+        self.assert_invalid_byte_dropped(truncated)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import epg_generator  # noqa: E402
+
+
+class AddProgramTimeOverlapTest(unittest.TestCase):
+    def test_duplicate_key_still_occupies_its_time_range(self):
+        # 跨零点节目：首条起止颠倒，同开始时间/同标题的第二条stop正确
+        programme_map = {}
+        channel_time_ranges = {}
+        add = epg_generator.add_program_if_no_time_overlap
+        self.assertTrue(add(programme_map, channel_time_ranges, "CCTV5+", "20260101230000 +0800", "20260101010000 +0800", "足球"))
+        self.assertTrue(add(programme_map, channel_time_ranges, "CCTV5+", "20260101230000 +0800", "20260102010000 +0800", "足球"))
+        # 第二条占用的区间挡住与之重合的节目
+        self.assertFalse(add(programme_map, channel_time_ranges, "CCTV5+", "20260102000000 +0800", "20260102020000 +0800", "篮球"))
+        # 节目表只保留同键的首条
+        self.assertEqual(
+            epg_generator.sort_programme_map(programme_map),
+            [("CCTV5+", "20260101230000 +0800", "20260101010000 +0800", "足球")]
+        )
+
+    def test_batch_add_counts_duplicate_key_like_single_add(self):
+        programme_map = {}
+        channel_time_ranges = {}
+        progs = [
+            ("20260101230000 +0800", "20260101010000 +0800", "足球"),
+            ("20260101230000 +0800", "20260102010000 +0800", "足球"),
+            ("20260102000000 +0800", "20260102020000 +0800", "篮球"),
+        ]
+        added = epg_generator.add_programs_if_no_time_overlap(programme_map, channel_time_ranges, "CCTV5+", progs)
+        self.assertEqual(added, 2)
+        self.assertEqual(len(programme_map["CCTV5+"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import epg_generator  # noqa: E402
+
+CHANNELS = [("CCTV1", ["CCTV1"])]
+PROGRAMMES = [("CCTV1", "20260101080000 +0800", "20260101090000 +0800", "新闻联播")]
+
+
+class BrokenGzWriter:
+    def write(self, data):
+        raise OSError("No space left on device")
+
+    def close(self):
+        pass
+
+
+class WriteEpgXmlGzErrorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_patch = mock.patch.dict(
+            epg_generator.EPG_CONFIG, {"LOG_PATH": os.path.join(self.tmp_dir.name, "epg_run.log")}
+        )
+        self.config_patch.start()
+        epg_generator.setup_logger()
+        self.xml_path = os.path.join(self.tmp_dir.name, "epg.xml")
+        self.gz_path = os.path.join(self.tmp_dir.name, "epg.xml.gz")
+
+    def tearDown(self):
+        for handler in list(epg_generator._LOGGER.handlers):
+            epg_generator._LOGGER.removeHandler(handler)
+            handler.close()
+        self.config_patch.stop()
+        self.tmp_dir.cleanup()
+
+    def write_xml(self):
+        return epg_generator.write_epg_xml(self.xml_path, self.gz_path, "test", "UTC", CHANNELS, PROGRAMMES)
+
+    def assert_xml_kept_without_gz(self, counts):
+        self.assertEqual(counts, (1, 1))
+        with open(self.xml_path, encoding="utf-8") as f:
+            self.assertTrue(f.read().endswith("</programme></tv>"))
+        self.assertFalse(os.path.exists(self.gz_path))
+        epg_generator.flush_log()
+        with open(epg_generator.EPG_CONFIG["LOG_PATH"], encoding="utf-8") as f:
+            self.assertIn("[GZ_ERROR]", f.read())
+
+    def test_gz_open_error_keeps_xml(self):
+        with mock.patch.object(epg_generator, "open_gz_writer", side_effect=OSError("Permission denied")):
+            self.assert_xml_kept_without_gz(self.write_xml())
+
+    def test_gz_write_error_keeps_xml(self):
+        with open(self.gz_path, "wb") as f:
+            f.write(b"partial")
+        with mock.patch.object(epg_generator, "open_gz_writer", return_value=BrokenGzWriter()):
+            self.assert_xml_kept_without_gz(self.write_xml())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import epg_generator  # noqa: E402
+
+
+class WriteLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp_dir.name, "epg_run.log")
+        self.config_patch = mock.patch.dict(epg_generator.EPG_CONFIG, {"LOG_PATH": self.log_path})
+        self.config_patch.start()
+        epg_generator.setup_logger()
+
+    def tearDown(self):
+        for handler in list(epg_generator._LOGGER.handlers):
+            epg_generator._LOGGER.removeHandler(handler)
+            handler.close()
+        self.config_patch.stop()
+        self.tmp_dir.cleanup()
+
+    def read_log(self):
+        with open(self.log_path, encoding="utf-8") as f:
+            return f.read()
+
+    def test_error_section_is_written_immediately(self):
+        epg_generator.write_log("普通日志", "STEP1")
+        self.assertEqual(self.read_log(), "")
+        epg_generator.write_log("下载失败", "DOWNLOAD_ERROR")
+        log_text = self.read_log()
+        self.assertIn("[STEP1] 普通日志", log_text)
+        self.assertIn("[DOWNLOAD_ERROR] 下载失败", log_text)
+
+    def test_detail_section_can_be_skipped(self):
+        with mock.patch.object(epg_generator, "_LOG_SKIP_DETAIL", True):
+            epg_generator.write_log("频道明细", "STEP3_DETAIL")
+            epg_generator.write_log("步骤汇总", "STEP3")
+        epg_generator.flush_log()
+        log_text = self.read_log()
+        self.assertNotIn("频道明细", log_text)
+        self.assertIn("[STEP3] 步骤汇总", log_text)
+
+
+if __name__ == "__main__":
+    unittest.main()